@@ -0,0 +1,95 @@
+"""Measures the cold start of a worker resolving the node types of its configurations.
+
+Each mode runs in a fresh interpreter, which imports the core, indexes the extensions and
+resolves the referenced `types`. `eager` imports every extension module as before lazy
+loading, `lazy-cold` builds the extension index and `lazy-warm` reads it from the cache.
+
+Run from the repository root:  python benchmarks/cold_start.py [--types flow:arraybatcher]
+"""
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+MODES = ("eager", "lazy-cold", "lazy-warm")
+
+
+def measure(mode: str, types: list[str]) -> dict:
+    """Resolves the node types in the current process and returns its timings."""
+    start = time.perf_counter()
+
+    # pylint: disable=import-outside-toplevel,protected-access
+    from core.app import AppController
+    from core.modules import Modules
+
+    core_seconds = time.perf_counter() - start
+
+    if mode == "eager":
+        for module_name in Modules._iter_module_names():
+            Modules._import_module(module_name)
+    else:
+        AppController.load()
+
+    for pipe_type in types:
+        Modules.get_node_cls(*pipe_type.split(":"))
+
+    return {
+        "mode": mode,
+        "core_seconds": core_seconds,
+        "seconds": time.perf_counter() - start,
+        "modules": len(sys.modules),
+        "peak_rss_bytes": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--mode", choices=MODES, help="measure a single mode")
+    parser.add_argument(
+        "--types", nargs="+", default=["flow:arraybatcher"], help="pipe:type pairs to resolve"
+    )
+    parser.add_argument("--repeat", type=int, default=5, help="runs per mode")
+    args = parser.parse_args()
+
+    if args.mode:
+        print(json.dumps(measure(args.mode, args.types)))
+        return
+
+    results = []
+    with tempfile.TemporaryDirectory() as state:
+        for mode in MODES:
+            runs = []
+            for _ in range(args.repeat):
+                if mode == "lazy-cold" and os.path.exists(os.path.join(state, "extensions.json")):
+                    os.remove(os.path.join(state, "extensions.json"))
+
+                process = subprocess.run(
+                    [sys.executable, __file__, "--mode", mode, "--types", *args.types],
+                    capture_output=True,
+                    check=True,
+                    text=True,
+                    env=os.environ | {"RIVEER_STATE": state},
+                )
+                runs.append(json.loads(process.stdout.strip().splitlines()[-1]))
+
+            best = min(runs, key=lambda run: run["seconds"])
+            results.append(best)
+
+    print(f"{'mode':>10} {'core [ms]':>10} {'total [ms]':>10} {'modules':>8} {'rss [MiB]':>10}")
+    for result in results:
+        print(
+            f"{result['mode']:>10} {result['core_seconds'] * 1000:>10.1f} "
+            f"{result['seconds'] * 1000:>10.1f} {result['modules']:>8} "
+            f"{result['peak_rss_bytes'] / 2**20:>10.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""Compares documents with columnar batches, by the JSON size and encoding time of a batch
+between two tasks and the time of transforming it like a Python Flow looping over rows and
+like the `ColumnTransform` Flow.
+
+Run from the repository root:  python benchmarks/columnar.py [--rows 100000]
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+# pylint: disable=wrong-import-position
+from core.columnar import ColumnarBatch
+from extensions.flows.column_transform import ColumnTransform
+
+CONFIG = {
+    "configuration": {"name": "benchmark", "pipe": "flow", "type": "columntransform"},
+    "processing": {
+        "outputs": ["sink"],
+        "compute": {"total": "price * quantity"},
+        "filter": "active and total > 100",
+        "cast": {"id": "str"},
+        "select": ["id", "name", "total"],
+    },
+}
+
+
+def make_rows(count: int) -> list[dict]:
+    return [
+        {
+            "id": i,
+            "name": f"item-{i}",
+            "price": (i % 500) / 3,
+            "quantity": i % 7,
+            "active": i % 3 != 0,
+        }
+        for i in range(count)
+    ]
+
+
+def transform_rows(rows: list[dict]) -> list[dict]:
+    """The same transformation as the configured one, row by row."""
+    results = []
+    for row in rows:
+        total = row["price"] * row["quantity"]
+        if row["active"] and total > 100:
+            results.append({"id": str(row["id"]), "name": row["name"], "total": total})
+
+    return results
+
+
+def round_trip(data):
+    """Encodes and decodes the data like a message between two tasks."""
+    return json.loads(json.dumps(data))
+
+
+def best_of(repeat: int, func, *args) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        timings.append(time.perf_counter() - start)
+
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    rows = make_rows(args.rows)
+    batch = ColumnarBatch.from_rows(rows)
+    node = ColumnTransform(CONFIG)
+
+    # the task wrapper is skipped, so only the transformation itself is measured
+    transform = lambda data: ColumnTransform.function(node, data)  # noqa: E731
+    assert transform(batch).to_rows() == transform_rows(rows)
+
+    print(f"{'format':<10} {'rows':>8} {'JSON [MiB]':>11} {'encode [s]':>11} {'transform [s]':>14}")
+    for name, data, func in (("rows", rows, transform_rows), ("columnar", batch, transform)):
+        encode_seconds = best_of(args.repeat, round_trip, data)
+        transform_seconds = best_of(args.repeat, func, data)
+        print(
+            f"{name:<10} {args.rows:>8} {len(json.dumps(data)) / 2**20:>11.1f} "
+            f"{encode_seconds:>11.3f} {transform_seconds:>14.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,266 @@
+"""Measures throughput, latency and memory of representative graph topologies.
+
+Each topology is built from YAML by the `AppController`, using in-memory stand-in
+nodes and Celery in eager mode, so the core hot paths are measured without a broker
+or external sources and sinks. Eager tasks still encode and decode their messages with
+the configured serializer. Each topology runs in its own process.
+Results are printed as JSON, or written to a file for comparison between releases.
+
+Run from the repository root:  python benchmarks/graph_throughput.py [--output results.json]
+"""
+
+import argparse
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+# pylint: disable=wrong-import-position
+import yaml
+from celery import Celery
+from voluptuous import Schema, Coerce, Optional
+
+from core.app import AppController
+from core.graph import NodeGraph
+from core.modules import Modules
+from core.node import Spring, Flow, Delta
+from core.cron import CronTask
+from core.trace import Trace
+
+
+class SyntheticSpring(Spring):
+    """Generates rows and sends them into the graph in chunks."""
+
+    @staticmethod
+    def config_schema() -> "Schema":
+        return Schema(
+            {
+                "tasks": [
+                    {
+                        "name": str,
+                        "cron": str,
+                        "outputs": [str],
+                        "rows": Coerce(int),
+                        Optional("chunk_size", default=1000): Coerce(int),
+                        Optional("columns", default=8): Coerce(int),
+                    }
+                ]
+            }
+        )
+
+    def connect(self) -> None:
+        return None
+
+    def get_periodic_tasks(self):
+        for config in self._config["tasks"]:
+            yield CronTask(
+                source=self,
+                task_name=config["name"],
+                task_args=[config["rows"], config["chunk_size"], config["columns"]],
+                task_schedule=config["cron"],
+                task_outputs=config["outputs"],
+            )
+
+    def function(self, data, *args):
+        rows, chunk_size, columns = data, args[0], args[1]
+        outputs = self.output_ids
+
+        for offset in range(0, rows, chunk_size):
+            chunk = [
+                {"id": i, **{f"col_{c}": f"value-{i}-{c}" for c in range(columns)}}
+                for i in range(offset, min(rows, offset + chunk_size))
+            ]
+            NodeGraph.send_result(chunk, outputs, self.fused_ids)
+
+
+class PassThrough(Flow):
+    """Returns its input unchanged."""
+
+    @staticmethod
+    def config_schema() -> "Schema":
+        return Schema({"processing": {"outputs": [str]}})
+
+    def function(self, data, *args):
+        return data
+
+
+class NullDelta(Delta):
+    """Discards its input and records the rows and end-to-end latency."""
+
+    rows = 0
+    latencies: list[float] = []
+    synchronizer = threading.Lock()
+
+    @staticmethod
+    def config_schema() -> "Schema":
+        return Schema({Optional("processing", default={}): dict})
+
+    def connect(self) -> None:
+        return None
+
+    def function(self, data, *args):
+        latency = time.time() - Trace.current()["origin"]
+
+        with NullDelta.synchronizer:
+            NullDelta.rows += len(data) if isinstance(data, list) else 1
+            NullDelta.latencies.append(latency)
+
+
+def _spring(outputs: list[str], rows: int, chunk_size: int) -> dict:
+    return {
+        "configuration": {"pipe": "spring", "type": "syntheticspring", "name": "source"},
+        "tasks": [
+            {
+                "name": "run",
+                "cron": "0 * * * *",
+                "outputs": outputs,
+                "rows": rows,
+                "chunk_size": chunk_size,
+            }
+        ],
+    }
+
+
+def _flow(name: str, node_type: str, outputs: list[str], **processing) -> dict:
+    return {
+        "configuration": {"pipe": "flow", "type": node_type, "name": name},
+        "processing": {"outputs": outputs, **processing},
+    }
+
+
+def _delta(name: str) -> dict:
+    return {"configuration": {"pipe": "delta", "type": "nulldelta", "name": name}}
+
+
+def _fan_out(rows: int) -> tuple[list[dict], int]:
+    deltas = [f"sink_{i}" for i in range(8)]
+    return [_spring(deltas, rows, 1000), *map(_delta, deltas)], rows * len(deltas)
+
+
+def _deep_chain(rows: int) -> tuple[list[dict], int]:
+    flows = [f"step_{i}" for i in range(8)]
+    configs = [_spring([flows[0]], rows, 1000), _delta("sink")]
+    configs += [
+        _flow(name, "passthrough", [flows[i + 1] if i + 1 < len(flows) else "sink"])
+        for i, name in enumerate(flows)
+    ]
+    return configs, rows
+
+
+def _batcher_burst(rows: int) -> tuple[list[dict], int]:
+    configs = [
+        _spring(["batcher"], rows, 10),
+        _flow("batcher", "arraybatcher", ["sink"], timeframe=1, max_items=5000),
+        _delta("sink"),
+    ]
+    return configs, rows
+
+
+TOPOLOGIES = {"fan_out": _fan_out, "deep_chain": _deep_chain, "batcher_burst": _batcher_burst}
+
+
+def _run_once(task_conf: dict, expected_rows: int) -> float:
+    """Triggers the spring task and returns the seconds until the deltas received all rows."""
+    NullDelta.rows, NullDelta.latencies = 0, []
+    spring_task = _app.tasks["spring-source-run-schedule"]
+
+    start = time.perf_counter()
+    spring_task.delay(task_conf["rows"], task_conf["chunk_size"], task_conf["columns"])
+
+    # batchers flush from timer threads
+    while NullDelta.rows < expected_rows:
+        time.sleep(0.001)
+
+    return time.perf_counter() - start
+
+
+def _percentile(values: list[float], percent: int) -> float:
+    return statistics.quantiles(values, n=100)[percent - 1] if len(values) > 1 else values[0]
+
+
+_app = Celery("riveer-benchmark", broker="memory://")
+_app.conf.task_always_eager = True
+
+
+def run_topology(name: str, rows: int) -> dict:
+    """Builds the topology from YAML and measures it in the current process."""
+    _app.set_current()
+    _app.set_default()
+
+    AppController.load()
+    for node_cls in (SyntheticSpring, PassThrough, NullDelta):
+        Modules.register(node_cls)
+
+    configs, expected_rows = TOPOLOGIES[name](rows)
+    with tempfile.TemporaryDirectory() as folder:
+        with open(os.path.join(folder, f"{name}.yaml"), "w", encoding="utf-8") as f:
+            yaml.safe_dump_all(configs, f)
+
+        os.environ["RIVEER_CONFIG"] = folder
+        AppController().configure()
+
+    task_conf = NodeGraph.get("source")._config["tasks"][0]  # pylint: disable=protected-access
+
+    _run_once(task_conf, expected_rows)  # warm-up
+    seconds = _run_once(task_conf, expected_rows)
+    latencies = NullDelta.latencies
+
+    tracemalloc.start()
+    _run_once(task_conf, expected_rows)
+    peak_traced = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {
+        "topology": name,
+        "rows": expected_rows,
+        "seconds": seconds,
+        "rows_per_second": expected_rows / seconds,
+        "latency_p50": _percentile(latencies, 50),
+        "latency_p95": _percentile(latencies, 95),
+        "latency_p99": _percentile(latencies, 99),
+        "peak_traced_bytes": peak_traced,
+        "peak_rss_bytes": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--topology", choices=TOPOLOGIES, help="run a single topology")
+    parser.add_argument("--rows", type=int, default=100_000, help="rows per spring run")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    args = parser.parse_args()
+
+    if args.topology:
+        print(json.dumps(run_topology(args.topology, args.rows)))
+        return
+
+    results = []
+    for name in TOPOLOGIES:
+        process = subprocess.run(
+            [sys.executable, __file__, "--topology", name, "--rows", str(args.rows)],
+            capture_output=True,
+            check=True,
+            text=True,
+        )
+        results.append(json.loads(process.stdout.strip().splitlines()[-1]))
+
+    report = json.dumps(
+        {"python": platform.python_version(), "rows": args.rows, "results": results}, indent=2
+    )
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(report)
+    print(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""Drives the adaptive mode of the OpenSearch delta against a local fake bulk
+endpoint with limited capacity and prints how the controller reacts.
+
+The fake cluster accepts at most `QUEUE_CAPACITY` documents in flight at once and
+rejects the rest of a request with status 429. Its latency grows with the chunk size.
+Run from the repository root:  python benchmarks/opensearch_backpressure.py
+"""
+
+import gzip
+import http.server
+import json
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+# pylint: disable=wrong-import-position,protected-access
+from extensions.deltas.opensearch import OpenSearch
+
+QUEUE_CAPACITY = 2_000
+SECONDS_PER_DOCUMENT = 0.00002
+BASE_LATENCY = 0.005
+
+
+class FakeBulkHandler(http.server.BaseHTTPRequestHandler):
+    in_flight = 0
+    synchronizer = threading.Lock()
+    stats = {"requests": 0, "accepted": 0, "rejected": 0}
+
+    def log_message(self, *_args):
+        pass
+
+    def _respond(self, status: int, payload: dict | None = None):
+        body = json.dumps(payload or {}).encode()
+        self.send_response(status)
+        self.send_header("content-type", "application/json")
+        self.send_header("content-length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_HEAD(self):  # pylint: disable=invalid-name
+        self._respond(200)
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        body = self.rfile.read(int(self.headers["content-length"]))
+        if self.headers.get("content-encoding") == "gzip":
+            body = gzip.decompress(body)
+
+        lines = body.splitlines()
+        documents = len(lines) // 2
+
+        cls = FakeBulkHandler
+        with cls.synchronizer:
+            accepted = max(0, min(documents, QUEUE_CAPACITY - cls.in_flight))
+            cls.in_flight += accepted
+            cls.stats["requests"] += 1
+            cls.stats["accepted"] += accepted
+            cls.stats["rejected"] += documents - accepted
+
+        time.sleep(BASE_LATENCY + accepted * SECONDS_PER_DOCUMENT)
+
+        with cls.synchronizer:
+            cls.in_flight -= accepted
+
+        items = [{"index": {"status": 201}}] * accepted
+        items += [{"index": {"status": 429, "error": {"type": "es_rejected"}}}] * (
+            documents - accepted
+        )
+        self._respond(200, {"took": 1, "errors": accepted < documents, "items": items})
+
+
+def main():
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), FakeBulkHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    delta = OpenSearch(
+        {
+            "configuration": {"name": "fake", "pipe": "delta", "type": "opensearch"},
+            "connection": {
+                "host": "127.0.0.1",
+                "port": server.server_address[1],
+                "user": "user",
+                "password": "password",
+                "use_ssl": False,
+            },
+            "processing": {
+                "index": "benchmark",
+                "mode": "adaptive",
+                "chunk_size": 200,
+                "max_chunk_size": 5_000,
+                "thread_count": 8,
+                "target_latency": 0.05,
+                "initial_backoff": 0.01,
+                "max_retries": 20,
+            },
+        }
+    )
+    delta.connect()
+
+    trajectory = []
+    record = delta._controller.record
+
+    def traced_record(latency, rejected):
+        record(latency, rejected)
+        trajectory.append((latency, rejected, *delta._controller.limits()))
+
+    delta._controller.record = traced_record
+
+    documents = [{"id": i, "value": f"document-{i}"} for i in range(200_000)]
+    start = time.monotonic()
+    delta._adaptive_bulk(documents)
+    elapsed = time.monotonic() - start
+
+    print(f"{'request':>7} {'latency [ms]':>12} {'rejected':>8} {'chunk':>6} {'threads':>7}")
+    for i, (latency, rejected, chunk_size, concurrency) in enumerate(trajectory):
+        print(f"{i:>7} {latency * 1000:>12.1f} {rejected:>8} {chunk_size:>6} {concurrency:>7}")
+
+    stats = FakeBulkHandler.stats
+    print(
+        f"\nindexed {stats['accepted']} documents in {elapsed:.2f}s with {stats['requests']} "
+        f"requests, {stats['rejected']} rejections were retried"
+    )
+    assert stats["accepted"] == len(documents)
+
+    delta.shutdown()
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
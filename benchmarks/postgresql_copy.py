@@ -0,0 +1,120 @@
+"""Measures the client-side decoding throughput of the COPY export of the PostgreSQL spring.
+
+A stand-in connection writes pre-encoded CSV or binary COPY output into the export in
+chunks like the server would, so the pipe, parsing and batching are measured without a
+database. Network and server time are not included.
+
+Run from the repository root:  python benchmarks/postgresql_copy.py [--rows 200000]
+"""
+
+import argparse
+import collections
+import os
+import struct
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+# pylint: disable=wrong-import-position
+from extensions.springs import postgresql_types as pg
+from extensions.springs.postgresql_copy import CopyExport
+
+Column = collections.namedtuple("Column", ["name", "type_code"])
+
+DESCRIPTION = [
+    Column("id", pg.INT8),
+    Column("name", pg.TEXT),
+    Column("score", pg.FLOAT8),
+    Column("active", pg.BOOL),
+    Column("created", pg.TIMESTAMP),
+]
+
+
+def _field(value: bytes) -> bytes:
+    return struct.pack(">i", len(value)) + value
+
+
+def encode_binary(rows: int) -> bytes:
+    tuples = [
+        struct.pack(">h", len(DESCRIPTION))
+        + _field(struct.pack(">q", i))
+        + _field(f"name-{i}".encode())
+        + _field(struct.pack(">d", i / 7))
+        + _field(b"\x01" if i % 2 else b"\x00")
+        + _field(struct.pack(">q", i * 1_000_000))
+        for i in range(rows)
+    ]
+    header = b"PGCOPY\n\xff\r\n\x00" + struct.pack(">ii", 0, 0)
+    return header + b"".join(tuples) + struct.pack(">h", -1)
+
+
+def encode_csv(rows: int) -> bytes:
+    return "".join(
+        f"{i},name-{i},{i / 7},{'t' if i % 2 else 'f'},2000-01-01 00:00:00\r\n" for i in range(rows)
+    ).encode()
+
+
+class _Cursor:
+    def __init__(self, data: bytes):
+        self._data = data
+        self.description = DESCRIPTION
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_args):
+        return None
+
+    def mogrify(self, query, _params):
+        return query.encode()
+
+    def execute(self, _query):
+        return None
+
+    def copy_expert(self, _statement, sink, size):
+        for offset in range(0, len(self._data), size // 16):
+            sink.write(self._data[offset : offset + size // 16])
+
+
+class _Connection:
+    encoding = "UTF8"
+
+    def __init__(self, data: bytes):
+        self._data = data
+
+    def cursor(self):
+        return _Cursor(self._data)
+
+    def cancel(self):
+        return None
+
+
+def measure(copy_format: str, data: bytes, chunk_size: int) -> tuple[float, int]:
+    export = CopyExport(_Connection(data), "SELECT", None, copy_format)
+
+    start = time.perf_counter()
+    rows = sum(len(batch) for batch in export.batches(chunk_size))
+    return time.perf_counter() - start, rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--chunk-size", type=int, default=10_000)
+    args = parser.parse_args()
+
+    print(f"{'format':<8} {'rows':>8} {'MiB':>8} {'seconds':>8} {'rows/s':>10}")
+    for copy_format, encode in (("csv", encode_csv), ("binary", encode_binary)):
+        data = encode(args.rows)
+        seconds, rows = min(measure(copy_format, data, args.chunk_size) for _ in range(3))
+        assert rows == args.rows
+
+        print(
+            f"{copy_format:<8} {rows:>8} {len(data) / 2**20:>8.1f} "
+            f"{seconds:>8.3f} {rows / seconds:>10.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""Compares the typed row converter of the PostgreSQL spring with the former
+`json.loads(json.dumps(rows, default=str))` round-trip.
+
+Run from the repository root:  python benchmarks/postgresql_rows.py
+"""
+
+import collections
+import datetime
+import decimal
+import json
+import os
+import sys
+import timeit
+import uuid
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+# pylint: disable=wrong-import-position
+from extensions.springs import postgresql_types as pg
+
+Column = collections.namedtuple("Column", ["name", "type_code"])
+
+_SAMPLES = [
+    (pg.INT8, lambda i: i),
+    (pg.TEXT, lambda i: f"value-{i}"),
+    (pg.FLOAT8, lambda i: i / 7),
+    (pg.BOOL, lambda i: i % 2 == 0),
+    (pg.NUMERIC, lambda i: decimal.Decimal(i) / 3),
+    (pg.TIMESTAMPTZ, lambda i: datetime.datetime.fromtimestamp(i, tz=datetime.timezone.utc)),
+    (pg.DATE, lambda i: datetime.date.fromordinal(730000 + i % 1000)),
+    (pg.UUID, lambda i: uuid.UUID(int=i)),
+]
+
+
+def make_result(columns: int, rows: int) -> tuple[list, list[tuple]]:
+    """Returns a cursor description and tuple rows cycling through common column types."""
+    description = [Column(f"col_{i}", _SAMPLES[i % len(_SAMPLES)][0]) for i in range(columns)]
+    factories = [_SAMPLES[i % len(_SAMPLES)][1] for i in range(columns)]
+
+    return description, [tuple(f(r) for f in factories) for r in range(rows)]
+
+
+def json_round_trip(description, rows):
+    """The former path: dictionary rows as built by `RealDictCursor`, dumped and parsed again."""
+    names = [c.name for c in description]
+    dict_rows = [dict(zip(names, row)) for row in rows]
+    return json.loads(json.dumps(dict_rows, default=str))
+
+
+def row_converter(description, rows):
+    return pg.RowConverter(description).convert(rows)
+
+
+def main():
+    shapes = {"wide": (200, 2_000), "tall": (8, 200_000), "tall-native": (4, 200_000)}
+
+    print(f"{'shape':<12} {'columns':>8} {'rows':>8} {'json [s]':>10} {'typed [s]':>10} {'speedup':>8}")
+    for shape, (columns, row_count) in shapes.items():
+        description, rows = make_result(columns, row_count)
+        assert json_round_trip(description, rows) == row_converter(description, rows)
+
+        baseline = min(timeit.repeat(lambda: json_round_trip(description, rows), number=1, repeat=3))
+        typed = min(timeit.repeat(lambda: row_converter(description, rows), number=1, repeat=3))
+
+        print(
+            f"{shape:<12} {columns:>8} {row_count:>8} "
+            f"{baseline:>10.3f} {typed:>10.3f} {baseline / typed:>7.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""Compares message size and encode/decode time of the serializers and
+compressions Riveer can use for messages between nodes.
+
+Requires the `msgpack`, `lz4` and `zstd` extras for the respective rows.
+Run from the repository root:  python benchmarks/serialization.py
+"""
+
+import os
+import sys
+import timeit
+
+from kombu import compression, serialization
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+# pylint: disable=wrong-import-position
+from core.compression import register_compressions
+
+SERIALIZERS = ["json", "msgpack"]
+COMPRESSIONS = [None, "zlib", "lz4", "zstd"]
+
+
+def make_rows(count: int) -> list[dict]:
+    """Returns rows shaped like the results of a spring query."""
+    return [
+        {
+            "id": i,
+            "name": f"entry-{i}",
+            "score": i / 7,
+            "active": i % 2 == 0,
+            "created_at": f"2024-01-01 {i % 24:02}:00:00+00:00",
+        }
+        for i in range(count)
+    ]
+
+
+def encode(data, serializer: str, method: str | None) -> tuple[bytes, str, str, str | None]:
+    content_type, content_encoding, body = serialization.dumps(data, serializer=serializer)
+    if isinstance(body, str):
+        body = body.encode(content_encoding)
+
+    mime = None
+    if method is not None:
+        body, mime = compression.compress(body, method)
+
+    return body, content_type, content_encoding, mime
+
+
+def decode(body: bytes, content_type: str, content_encoding: str, mime: str | None):
+    if mime is not None:
+        body = compression.decompress(body, mime)
+
+    return serialization.loads(body, content_type, content_encoding, accept={content_type})
+
+
+def main():
+    register_compressions()
+
+    header = f"{'rows':>7} {'serializer':<10} {'compression':<11} {'bytes':>11} "
+    print(header + f"{'encode [ms]':>12} {'decode [ms]':>12}")
+
+    for count in [10, 1_000, 100_000]:
+        data = make_rows(count)
+        number = max(1, 10_000 // count)
+
+        for serializer in SERIALIZERS:
+            for method in COMPRESSIONS:
+                try:
+                    message = encode(data, serializer, method)
+                except Exception as e:  # pylint: disable=broad-exception-caught
+                    print(f"{count:>7} {serializer:<10} {str(method):<11} unavailable: {e}")
+                    continue
+
+                assert decode(*message) == data
+
+                encode_time = timeit.timeit(lambda: encode(data, serializer, method), number=number)
+                decode_time = timeit.timeit(lambda: decode(*message), number=number)
+
+                print(
+                    f"{count:>7} {serializer:<10} {str(method):<11} {len(message[0]):>11} "
+                    f"{encode_time / number * 1000:>12.3f} {decode_time / number * 1000:>12.3f}"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,14 @@
-import atexit
 import logging
 import os
 
 import yaml
-from voluptuous import Schema, All, Coerce, Optional, Any
+from celery import current_app as celery_app
+from kombu import Exchange, Queue
+from voluptuous import Schema, All, Coerce, Optional, Any, Range
 
 from core.graph import NodeGraph
 from core.modules import Modules
-from core.node import Spring, Flow, Delta
+from core.node import Spring, Flow, Delta, GraphReader
 
 LowerVal = lambda *t: All(Coerce(lambda s: str(s).lower()), *t)
 EnvStr = lambda *t: All(Coerce(lambda s: os.path.expandvars(str(s))), *t)
@@ -16,9 +17,12 @@ EnvStr = lambda *t: All(Coerce(lambda s: os.path.expandvars(str(s))), *t)
 class AppController:
     """This is the central controller of the app."""
 
+    _connected_pid: int | None = None
+    _process_count = 1
+
     @staticmethod
     def load():
-        """Loads all available modules into the app."""
+        """Indexes all available modules, which are imported once a configuration uses them."""
         logging.info("Initializing modules.")
         Modules.initialize()
 
@@ -27,14 +31,14 @@ class AppController:
         logging.info("Loading configurations.")
         self._load_configurations()
 
-        logging.info("Creating and validating node tasks")
-        self._create_node_tasks()
+        logging.info("Validating fused node connections")
+        self._validate_fusion()
 
-        logging.info("Registering cleanup task")
-        atexit.register(self._shutdown)
+        logging.info("Declaring node queues")
+        self._declare_queues()
 
-        logging.info("Establishing node connections")
-        self._establish_connections()
+        logging.info("Creating and validating node tasks")
+        self._create_node_tasks()
 
     def _load_configurations(self):
         folder = os.getenv("RIVEER_CONFIG", "./configs")
@@ -60,6 +64,38 @@ class AppController:
                     "pipe": LowerVal(Any("spring", "flow", "delta")),
                     "type": LowerVal(),
                     Optional("name", default=default_name): LowerVal(str),
+                    Optional("serializer"): LowerVal(Any("json", "msgpack")),
+                    Optional("compression"): LowerVal(
+                        Any("zlib", "bzip2", "lzma", "lz4", "zstd", "brotli")
+                    ),
+                    Optional("fuse", default=[]): [str],
+                    Optional("queue"): str,
+                    Optional("concurrency"): All(Coerce(int), Range(min=1)),
+                    Optional("acks_late"): Coerce(bool),
+                    Optional("time_limit"): {
+                        Optional("soft"): All(Coerce(float), Range(min=0, min_included=False)),
+                        Optional("hard"): All(Coerce(float), Range(min=0, min_included=False)),
+                    },
+                    Optional("coalesce"): {
+                        Optional("max_items", default=5000): All(Coerce(int), Range(min=1)),
+                        Optional("max_wait", default=0.05): All(Coerce(float), Range(min=0)),
+                    },
+                    Optional("spill"): {
+                        Optional("max_bytes", default=1 << 30): All(Coerce(int), Range(min=1)),
+                        Optional("segment_bytes", default=64 << 20): All(
+                            Coerce(int), Range(min=1)
+                        ),
+                        Optional("eviction", default="oldest"): LowerVal(Any("oldest", "newest")),
+                        Optional("drain_items", default=10_000): All(Coerce(int), Range(min=1)),
+                        Optional("retry_interval", default=1): All(
+                            Coerce(float), Range(min=0, min_included=False)
+                        ),
+                        Optional("max_interval", default=60): All(
+                            Coerce(float), Range(min=0, min_included=False)
+                        ),
+                        Optional("max_attempts", default=5): All(Coerce(int), Range(min=1)),
+                        Optional("fsync", default=False): Coerce(bool),
+                    },
                 },
                 Any(str): Any(dict, list, str, int),
             }
@@ -75,20 +111,87 @@ class AppController:
 
         NodeGraph.register_node(file_config["name"], cls.from_configuration(base_config))
 
+    @staticmethod
+    def _validate_fusion():
+        """Checks that fused outputs are readers of the node which can run in-process."""
+        for name, node in NodeGraph.iter_over_nodes():
+            for output_id in node.fused_ids:
+                output = NodeGraph.get(output_id)
+
+                if output_id not in node.output_ids:
+                    raise ValueError(f"Node `{name}` fuses `{output_id}` which is no output.")
+                if not isinstance(output, GraphReader):
+                    raise ValueError(f"Node `{name}` cannot fuse `{output_id}` into its process.")
+                if not output.fusable:
+                    raise ValueError(f"Node `{output_id}` of type `{output.id()}` is not fusable.")
+
+                logging.info("Running node `%s` in the process of `%s`", output_id, name)
+
+    @staticmethod
+    def _declare_queues():
+        """Declares the queue of each node, so workers started without `-Q` consume all."""
+        queues = celery_app.amqp.queues
+
+        for _, node in NodeGraph.iter_over_nodes():
+            if node.queue not in queues:
+                queues.add(Queue(node.queue, Exchange(node.queue), routing_key=node.queue))
+
+    @classmethod
+    def connect_process(cls) -> None:
+        """Connects the nodes once in the current worker process. Their clients are not
+        fork-safe, so each process of a prefork pool opens its own connections."""
+        if cls._connected_pid == os.getpid():
+            return
+
+        logging.info("Establishing node connections in process %s", os.getpid())
+        cls._connected_pid = os.getpid()
+        cls._establish_connections()
+
+    @classmethod
+    def shutdown_process(cls) -> None:
+        """Shuts the nodes down if they were connected in the current worker process."""
+        if cls._connected_pid != os.getpid():
+            return
+
+        cls._connected_pid = None
+        cls._shutdown()
+
+    @classmethod
+    def set_process_count(cls, count: int) -> None:
+        """Sets the number of worker processes sharing the connection limits of the nodes."""
+        cls._process_count = max(1, count)
+
+    @classmethod
+    def process_count(cls) -> int:
+        """Returns the number of worker processes, which each keep their own node state."""
+        return cls._process_count
+
+    @classmethod
+    def process_share(cls, limit: int) -> int:
+        """Returns the part of a worker-wide limit available to each of its processes."""
+        return max(1, limit // cls._process_count)
+
     @staticmethod
     def _establish_connections():
-        """Runs `connect` for each IO-Node."""
-        for name, node in NodeGraph.iter_over_nodes(Spring, Delta):
+        """Runs `connect` for each Node, including Flows keeping local state."""
+        for name, node in NodeGraph.iter_over_nodes():
             try:
                 node.connect()
+
+                if isinstance(node, Delta):
+                    node.open_buffers()
             except Exception as e:
-                logging.error("Spring `%s` failed to connect to its source", name)
+                logging.error("Node `%s` failed to connect to its source", name)
                 raise e
 
     @staticmethod
     def _shutdown():
         """Runs cleanup function on app shutdown."""
-        for _, node in NodeGraph.iter_over_nodes(Spring, Delta):
+        for _, node in NodeGraph.iter_over_nodes():
+            # buffers stop sending before the connections close
+            if isinstance(node, Delta):
+                node.close_buffers()
+
             node.shutdown()
 
     @staticmethod
@@ -0,0 +1,115 @@
+import threading
+import typing
+from concurrent.futures import Future
+
+from core.metrics import Metrics
+from core.spill import PartialSendError
+
+if typing.TYPE_CHECKING:
+    type Data = list | dict
+
+
+class _Batch:
+    __slots__ = ("items", "invocations", "sealed", "result")
+
+    def __init__(self):
+        self.items: list = []
+        self.invocations = 0
+        self.sealed = False
+        self.result: Future = Future()
+
+
+class WriteCoalescer:
+    """This merges the documents of concurrent invocations of a delta in the process into
+    one call of up to `max_items` documents. The first invocation leads the batch: it waits up
+    to `max_wait` seconds for others to join and sends the merged documents in its own thread,
+    while the others wait for the result. It only waits while other invocations are running,
+    as none join otherwise, e.g. on a pool of processes.
+
+    If a merged send fails, every invocation raises its error, unless the sink raised a
+    `PartialSendError`, which is split into the failed documents of each invocation."""
+
+    def __init__(self, name: str, func: typing.Callable, config: dict):
+        self._name = name
+        self._func = func
+        self._config = config
+
+        self._batch: _Batch | None = None
+        self._running = 0
+        self._condition = threading.Condition()
+
+    def _seal(self, batch: _Batch) -> None:
+        """Closes the batch for new invocations and wakes its leader, must hold the lock."""
+        batch.sealed = True
+        if self._batch is batch:
+            self._batch = None
+
+        self._condition.notify_all()
+
+    def __call__(self, data: "Data", *args) -> None:
+        max_items = self._config["max_items"]
+
+        # single documents may be sent as objects, so only lists are merged
+        if args or not isinstance(data, list):
+            return self._func(data, *args)
+
+        with self._condition:
+            if self._batch is not None and len(self._batch.items) + len(data) > max_items:
+                self._seal(self._batch)
+
+            if leader := self._batch is None:
+                self._batch = _Batch()
+
+            batch = self._batch
+            start = len(batch.items)
+            batch.items += data
+            batch.invocations += 1
+            self._running += 1
+
+            if len(batch.items) >= max_items:
+                self._seal(batch)
+
+            if leader:
+                if self._running > 1:
+                    self._condition.wait_for(lambda: batch.sealed, self._config["max_wait"])
+                self._seal(batch)
+
+        try:
+            if leader:
+                Metrics.observe("riveer_coalesced_invocations", batch.invocations, node=self._name)
+
+                try:
+                    self._func(batch.items)
+                    batch.result.set_result(None)
+
+                except Exception as e:  # pylint: disable=broad-exception-caught
+                    batch.result.set_exception(e)
+
+            return self._result(batch, batch.items[start : start + len(data)])
+
+        finally:
+            with self._condition:
+                self._running -= 1
+
+    def _result(self, batch: _Batch, documents: list) -> None:
+        """Waits for the send of the batch and raises the failures of the documents."""
+        try:
+            return batch.result.result()
+
+        except PartialSendError as e:
+            if batch.invocations == 1:
+                raise
+
+            transient_ids, failed_ids = set(map(id, e.transient)), set(map(id, e.failed))
+            transient = [document for document in documents if id(document) in transient_ids]
+            failed = [document for document in documents if id(document) in failed_ids]
+
+            if transient or failed:
+                raise PartialSendError(
+                    f"{len(transient) + len(failed)} of {len(documents)} document(s) failed "
+                    f"in a merged send of delta `{self._name}`.",
+                    transient,
+                    failed,
+                ) from e
+
+            return None
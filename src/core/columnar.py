@@ -0,0 +1,78 @@
+import functools
+import typing
+
+if typing.TYPE_CHECKING:
+    type Data = list | dict
+
+COLUMNS_KEY = "__columns__"
+
+
+class ColumnarBatch(dict):
+    """A batch of rows stored as one list per column under the `__columns__` key, so each
+    field name is encoded once per batch instead of once per row. Being a plain dict, it is
+    sent like any other data and arrives at remote nodes as one."""
+
+    def __init__(self, columns: dict[str, list]):
+        super().__init__({COLUMNS_KEY: columns})
+
+    @property
+    def columns(self) -> dict[str, list]:
+        """Returns the values of each column by its name."""
+        return self[COLUMNS_KEY]
+
+    @property
+    def num_rows(self) -> int:
+        return len(next(iter(self.columns.values()), ()))
+
+    @classmethod
+    def from_rows(cls, rows: list[dict], fields: list[str] | None = None) -> "ColumnarBatch":
+        """Returns the rows as columns, by default of every field of any row."""
+        if fields is None:
+            fields = list(dict.fromkeys(field for row in rows for field in row))
+
+        return cls({field: [row.get(field) for row in rows] for field in fields})
+
+    def to_rows(self) -> list[dict]:
+        """Returns the batch as a list of documents."""
+        names = list(self.columns)
+        return [dict(zip(names, values)) for values in zip(*self.columns.values())]
+
+
+def is_columnar(data: "Data") -> bool:
+    """Returns whether the data is a columnar batch, also when received as a plain dict."""
+    return isinstance(data, dict) and len(data) == 1 and COLUMNS_KEY in data
+
+
+def as_batch(data: "Data") -> ColumnarBatch:
+    """Returns the data as a columnar batch, converting rows if required."""
+    if isinstance(data, ColumnarBatch):
+        return data
+    if is_columnar(data):
+        return ColumnarBatch(data[COLUMNS_KEY])
+
+    return ColumnarBatch.from_rows([data] if isinstance(data, dict) else data)
+
+
+def as_rows(data: "Data") -> "Data":
+    """Returns columnar batches as a list of documents and any other data unchanged."""
+    return as_batch(data).to_rows() if is_columnar(data) else data
+
+
+def row_count(data: "Data | None") -> int:
+    """Returns the number of rows of the data in any format."""
+    if data is None:
+        return 0
+    if is_columnar(data):
+        return as_batch(data).num_rows
+
+    return len(data) if isinstance(data, list) else 1
+
+
+def rows_only(func: typing.Callable) -> typing.Callable:
+    """Wraps a node function, so it receives columnar batches as a list of documents."""
+
+    @functools.wraps(func)
+    def inner(data, *args, **kwargs):
+        return func(as_rows(data), *args, **kwargs)
+
+    return inner
@@ -0,0 +1,14 @@
+from kombu import compression
+
+
+def register_compressions() -> None:
+    """Registers the compressions of the optional extras kombu does not provide itself.
+    kombu already registers `zstd` and `brotli` once their packages are installed."""
+    try:
+        import lz4.frame  # pylint: disable=import-outside-toplevel
+    except ImportError:
+        return
+
+    compression.register(
+        lz4.frame.compress, lz4.frame.decompress, "application/x-lz4", aliases=["lz4"]
+    )
@@ -1,14 +1,22 @@
+import fcntl
+import functools
+import hashlib
 import logging
+import os
+import typing
 
 from celery.schedules import crontab
 from celery import current_app as celery_app
 
 from core.graph import NodeGraph
 from core.node import GraphWriter, GraphReader
+from core.state import state_path
 from core.task import TaskWrapper
 
 logger = logging.getLogger("CronTask")
 
+OVERLAP_POLICIES = ("allow", "skip", "coalesce")
+
 
 class CronTask:
     def __init__(
@@ -18,6 +26,8 @@ class CronTask:
         task_schedule: str,
         task_args: list | tuple,
         task_outputs: list[str],
+        jitter: int | None = None,
+        overlap: str | None = None,
     ):
         self._source = source
         self.name = f"{source.node_type()}-{source.name}-{task_name}-schedule"
@@ -25,6 +35,14 @@ class CronTask:
         self._task_args = task_args
         self._output_ids = task_outputs
 
+        if jitter is None:
+            jitter = int(os.getenv("RIVEER_CRON_JITTER", "0"))
+        self._offset = self._jitter_offset(self.name, jitter)
+
+        self._overlap = overlap or os.getenv("RIVEER_CRON_OVERLAP", "allow").lower()
+        if self._overlap not in OVERLAP_POLICIES:
+            raise ValueError(f"Invalid overlap policy `{self._overlap}` of task `{self.name}`.")
+
         for output_id in self._output_ids:
             self.check_pipeline(output_id, [f"{source.name}/{task_name}"])
 
@@ -61,18 +79,78 @@ class CronTask:
         fields = ["minute", "hour", "day_of_month", "month_of_year", "day_of_week"]
         return crontab(**{name: parts.get(i, "*") for i, name in enumerate(fields)})
 
+    @staticmethod
+    def _jitter_offset(name: str, jitter: int) -> int:
+        """Returns a stable offset of up to `jitter` seconds, spreading equally scheduled tasks."""
+        if jitter <= 0:
+            return 0
+
+        digest = hashlib.sha1(name.encode("utf-8")).digest()
+        return int.from_bytes(digest[:8], "big") % (jitter + 1)
+
+    def _exclusive(self, func: typing.Callable) -> typing.Callable:
+        """Wraps the function so that only one run of this task is in flight across workers
+        on the host. Overlapping runs are dropped, or rerun once afterward when coalescing.
+        The lock is a local file, so runs on other hosts are not guarded."""
+        lock_path = state_path("cron", f"{self.name}.lock")
+        pending_path = state_path("cron", f"{self.name}.pending")
+
+        @functools.wraps(func)
+        def inner(*args, **kwargs):
+            while True:
+                with open(lock_path, "a", encoding="utf-8") as lock:
+                    try:
+                        fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    except BlockingIOError:
+                        if self._overlap == "coalesce":
+                            open(pending_path, "w", encoding="utf-8").close()
+                            logger.info("Task %s is still running, coalescing run", self.name)
+                        else:
+                            logger.warning("Task %s is still running, skipping run", self.name)
+                        return None
+
+                    try:
+                        result = func(*args, **kwargs)
+                    finally:
+                        fcntl.flock(lock, fcntl.LOCK_UN)
+
+                # checked after unlocking, so runs requested meanwhile are not lost
+                if self._overlap != "coalesce" or not os.path.exists(pending_path):
+                    return result
+
+                try:
+                    os.remove(pending_path)
+                except FileNotFoundError:
+                    return result
+
+                if result is not None:
+                    NodeGraph.send_result(result, self._output_ids, self._source.fused_ids)
+
+        return inner
+
     def schedule_task_function(self):
         """Schedules a new task from the config of this object."""
+        function = self._source.function
+        if self._overlap != "allow":
+            function = self._exclusive(function)
+
         task = celery_app.task(
-            TaskWrapper(self._source.function, self._output_ids),
+            TaskWrapper(
+                function,
+                self._output_ids,
+                self._source.fused_ids,
+                self._source.time_limit,
+                self._source.task_slots,
+            ),
             name=self.name,
             bind=True,
+            **self._source.task_options(),
         )
         celery_app.add_periodic_task(
             sig=task.s(*self._task_args),
             name=self.name,
             schedule=self._schedule,
+            options={"countdown": self._offset} if self._offset else {},
         )
 
 # ToDo: point to invalid or undefined fields on validation!
-# ToDo: proper task timeouts
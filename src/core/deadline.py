@@ -0,0 +1,151 @@
+import contextlib
+import contextvars
+import heapq
+import itertools
+import logging
+import threading
+import time
+import typing
+
+logger = logging.getLogger("Deadline")
+
+_current_deadline: contextvars.ContextVar["Deadline | None"] = contextvars.ContextVar(
+    "riveer_deadline", default=None
+)
+
+
+class TaskTimeoutError(TimeoutError):
+    """Raised when a task continues working after its time limit expired."""
+
+
+class Deadline:
+    """This is the time budget of a running task. Once it expires, a watchdog thread
+    runs the cancel callbacks registered by the node, e.g. cancelling a database query,
+    so blocked work is interrupted on every worker pool. Finished deadlines stay in the
+    heap of the watchdog until they make up half of it, which is then compacted."""
+
+    _entries: list[tuple[float, int, "Deadline"]] = []
+    _finished_entries = 0
+    _counter = itertools.count()
+    _condition = threading.Condition()
+    _watchdog: threading.Thread | None = None
+
+    def __init__(self, task_name: str, seconds: float):
+        self.task_name = task_name
+        self.seconds = seconds
+        self.expires = time.monotonic() + seconds
+        self.expired = False
+
+        self._finished = False
+        self._callbacks: list[typing.Callable[[], typing.Any]] = []
+        self._synchronizer = threading.Lock()
+
+        with Deadline._condition:
+            heapq.heappush(Deadline._entries, (self.expires, next(Deadline._counter), self))
+            Deadline._condition.notify()
+
+            if Deadline._watchdog is None or not Deadline._watchdog.is_alive():
+                Deadline._watchdog = threading.Thread(
+                    target=Deadline._watch, name="deadline-watchdog", daemon=True
+                )
+                Deadline._watchdog.start()
+
+    def remaining(self) -> float:
+        """Returns the seconds left until the deadline expires."""
+        return max(0.0, self.expires - time.monotonic())
+
+    def finish(self) -> None:
+        """Marks the task as done, so its callbacks are not run anymore."""
+        with self._synchronizer:
+            if self._finished:
+                return
+
+            self._finished = True
+            self._callbacks.clear()
+
+        with Deadline._condition:
+            Deadline._finished_entries += 1
+
+            # removing every entry would cost a linear search, so they are dropped in bulk
+            if Deadline._finished_entries * 2 > len(Deadline._entries) >= 64:
+                Deadline._entries = [e for e in Deadline._entries if not e[2]._finished]
+                heapq.heapify(Deadline._entries)
+                Deadline._finished_entries = 0
+
+    def _expire(self) -> None:
+        with self._synchronizer:
+            if self._finished:
+                return
+
+            self.expired = True
+            callbacks = list(self._callbacks)
+
+        logger.warning("Task %s exceeded its time limit of %ss", self.task_name, self.seconds)
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                logger.error(
+                    "[%s] Failed to cancel task %s because: %s",
+                    *(e.__class__.__name__, self.task_name, str(e)),
+                )
+
+    @classmethod
+    def _watch(cls) -> None:
+        while True:
+            with cls._condition:
+                while not cls._entries or cls._entries[0][0] > time.monotonic():
+                    timeout = cls._entries[0][0] - time.monotonic() if cls._entries else None
+                    cls._condition.wait(timeout)
+
+                _, _, deadline = heapq.heappop(cls._entries)
+                if deadline._finished:
+                    cls._finished_entries -= 1
+                    continue
+
+            deadline._expire()
+
+    @staticmethod
+    def enter(deadline: "Deadline") -> contextvars.Token:
+        """Marks the deadline of the task executed in the current context."""
+        return _current_deadline.set(deadline)
+
+    @staticmethod
+    def exit(token: contextvars.Token) -> None:
+        _current_deadline.reset(token)
+
+    @staticmethod
+    def current() -> "Deadline | None":
+        """Returns the deadline of the task executed in the current context if any."""
+        return _current_deadline.get()
+
+    @staticmethod
+    def timeout(default: float, deadline: "Deadline | None" = None) -> float:
+        """Returns the timeout bounded by the remaining time of the given or current deadline.
+        Raises a `TaskTimeoutError` if it already expired, so no new work is started."""
+        if (deadline := deadline or Deadline.current()) is None:
+            return default
+
+        if deadline.expired or (remaining := deadline.remaining()) <= 0:
+            raise TaskTimeoutError(f"Task {deadline.task_name} exceeded its time limit.")
+
+        return min(default, remaining)
+
+    @staticmethod
+    @contextlib.contextmanager
+    def on_expiry(callback: typing.Callable[[], typing.Any]) -> typing.Iterator[None]:
+        """Runs the callback from the watchdog if the current deadline expires within the block."""
+        if (deadline := Deadline.current()) is None:
+            yield
+            return
+
+        with deadline._synchronizer:
+            if deadline.expired:
+                raise TaskTimeoutError(f"Task {deadline.task_name} exceeded its time limit.")
+            deadline._callbacks.append(callback)
+        try:
+            yield
+        finally:
+            with deadline._synchronizer:
+                if callback in deadline._callbacks:
+                    deadline._callbacks.remove(callback)
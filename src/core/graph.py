@@ -1,6 +1,12 @@
+import time
 import typing
 
+from core.metrics import Metrics
+from core.trace import Trace
+
 if typing.TYPE_CHECKING:
+    from core.payload import PayloadStore
+    from core.trace import TraceEnvelope
     from src.core.node import Delta, Flow, Spring
 
     type Data = list | dict
@@ -12,6 +18,7 @@ class NodeGraph:
     """This holds the names of each Node that can be triggered."""
 
     _pipe_name_mapping: dict[str, "NodeType"] = {}
+    _payload_store: typing.Optional["PayloadStore"] = None
 
     @classmethod
     def get(cls, node_name: str) -> typing.Optional["NodeType"]:
@@ -19,11 +26,66 @@ class NodeGraph:
         return cls._pipe_name_mapping.get(node_name)
 
     @classmethod
-    def send_result(cls, data: "Data", readers: list[str]) -> None:
-        """Send a data object to many consumers."""
-        for reader in readers:
+    def set_payload_store(cls, store: typing.Optional["PayloadStore"]) -> None:
+        """Sets the store used for passing large results by reference."""
+        cls._payload_store = store
+
+    @classmethod
+    def send_result(
+        cls,
+        data: "Data",
+        readers: list[str],
+        fused: typing.Container[str] = (),
+        trace: typing.Optional["TraceEnvelope"] = None,
+    ) -> None:
+        """Send a data object to many consumers.
+        Fused consumers run in the current process and receive the object itself, while
+        large objects are stored once and only their reference is sent to the others.
+        The trace of the current pipeline run is passed along unless one is provided."""
+        remote_readers = [reader for reader in readers if reader not in fused]
+
+        options = {}
+        if (trace := trace or Trace.current()) is not None:
+            options["trace"] = Trace.stamp_sent(trace)
+
+        Metrics.record_payload("out", data, Metrics.current_task())
+        Metrics.observe("riveer_send_fanout", len(readers))
+
+        reference = None
+        if cls._payload_store is not None and remote_readers:
+            reference = cls._payload_store.store(data)
+
+        for reader in remote_readers:
             node = cls.get(reader)
-            node.function.delay(data)
+            start = time.perf_counter()
+
+            if reference is None:
+                node.function.delay(data, **options)
+            else:
+                node.function.delay(None, payload_ref=reference, **options)
+
+            cls._record_sent(reader, start)
+
+        # remote messages are already encoded, so fused consumers cannot affect them
+        for reader in readers:
+            if reader in fused:
+                start = time.perf_counter()
+                cls.get(reader).function(data, **options)
+                cls._record_sent(reader, start)
+
+    @staticmethod
+    def _record_sent(reader: str, start: float) -> None:
+        Metrics.inc("riveer_messages_sent_total", reader=reader)
+        duration = time.perf_counter() - start
+        Metrics.observe("riveer_enqueue_duration_seconds", duration, reader=reader)
+
+    @classmethod
+    def load_payload(cls, reference: str) -> "Data":
+        """Returns the data of a result that was sent by reference."""
+        if cls._payload_store is None:
+            raise ValueError("Received a payload reference, but no payload store is configured.")
+
+        return cls._payload_store.load(reference)
 
     @classmethod
     def register_node(cls, name: str, node: "NodeType"):
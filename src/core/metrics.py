@@ -0,0 +1,200 @@
+import bisect
+import contextvars
+import http.server
+import json
+import logging
+import threading
+import typing
+
+from core.columnar import row_count
+
+if typing.TYPE_CHECKING:
+    type Data = list | dict
+    type LabelKey = tuple[tuple[str, str], ...]
+
+logger = logging.getLogger("Metrics")
+
+_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+_FANOUT_BUCKETS = (1, 2, 4, 8, 16, 32)
+
+# name: (type, help, histogram buckets)
+_DEFINITIONS: dict[str, tuple[str, str, tuple]] = {
+    "riveer_task_duration_seconds": (
+        "histogram",
+        "Execution time of node tasks.",
+        _LATENCY_BUCKETS,
+    ),
+    "riveer_task_failures_total": ("counter", "Node tasks that raised an exception.", ()),
+    "riveer_task_timeouts_total": ("counter", "Node tasks that exceeded their time limit.", ()),
+    "riveer_task_rows_in_total": ("counter", "Rows received by node tasks.", ()),
+    "riveer_task_bytes_in_total": ("counter", "JSON bytes received by node tasks.", ()),
+    "riveer_task_rows_out_total": ("counter", "Rows sent into the graph by node tasks.", ()),
+    "riveer_task_bytes_out_total": ("counter", "JSON bytes sent into the graph by node tasks.", ()),
+    "riveer_send_fanout": ("histogram", "Readers a single result is sent to.", _FANOUT_BUCKETS),
+    "riveer_messages_sent_total": ("counter", "Results sent to a reader node.", ()),
+    "riveer_queue_wait_seconds": (
+        "histogram",
+        "Time between sending a result and a node task starting to process it.",
+        _LATENCY_BUCKETS,
+    ),
+    "riveer_pipeline_latency_seconds": (
+        "histogram",
+        "Time from the start of a pipeline run until a delta finished processing it.",
+        _LATENCY_BUCKETS,
+    ),
+    "riveer_enqueue_duration_seconds": (
+        "histogram",
+        "Time spent handing a result to the broker or a fused node.",
+        _LATENCY_BUCKETS,
+    ),
+    "riveer_coalesced_invocations": (
+        "histogram",
+        "Delta invocations merged into one send.",
+        _FANOUT_BUCKETS,
+    ),
+    "riveer_spill_rows_total": ("counter", "Rows a delta kept on disk while its sink failed.", ()),
+    "riveer_spill_drained_rows_total": (
+        "counter",
+        "Spilled rows a delta sent later or moved to its dead letters.",
+        (),
+    ),
+    "riveer_spill_dead_rows_total": ("counter", "Spilled rows a delta failed to send.", ()),
+    "riveer_spill_evicted_bytes_total": ("counter", "Unsent bytes evicted from spill logs.", ()),
+}
+
+_current_task: contextvars.ContextVar[str] = contextvars.ContextVar("riveer_task", default="")
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: "LabelKey", extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in labels]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Metrics:
+    """This collects per-node measurements in the process and exposes them
+    in the Prometheus text format. Recording is a no-op until enabled."""
+
+    _enabled = False
+    _synchronizer = threading.Lock()
+    _counters: dict[tuple[str, "LabelKey"], float] = {}
+    _histograms: dict[tuple[str, "LabelKey"], list[float]] = {}
+
+    @classmethod
+    def enable(cls) -> None:
+        cls._enabled = True
+
+    @classmethod
+    def inc(cls, name: str, value: float = 1, **labels: str) -> None:
+        """Increases a counter by the value."""
+        if not cls._enabled:
+            return
+
+        key = (name, tuple(sorted(labels.items())))
+        with cls._synchronizer:
+            cls._counters[key] = cls._counters.get(key, 0) + value
+
+    @classmethod
+    def observe(cls, name: str, value: float, **labels: str) -> None:
+        """Adds a value to a histogram."""
+        if not cls._enabled:
+            return
+
+        buckets = _DEFINITIONS[name][2]
+        key = (name, tuple(sorted(labels.items())))
+
+        with cls._synchronizer:
+            # one count per bucket, followed by the sum and total count
+            if (values := cls._histograms.get(key)) is None:
+                values = cls._histograms[key] = [0] * (len(buckets) + 2)
+
+            values[bisect.bisect_left(buckets, value)] += 1
+            values[-2] += value
+            values[-1] += 1
+
+    @classmethod
+    def enter_task(cls, task_name: str) -> contextvars.Token:
+        """Marks the task which is executed in the current context."""
+        return _current_task.set(task_name)
+
+    @classmethod
+    def exit_task(cls, token: contextvars.Token) -> None:
+        _current_task.reset(token)
+
+    @classmethod
+    def current_task(cls) -> str:
+        """Returns the name of the task executed in the current context if any."""
+        return _current_task.get()
+
+    @classmethod
+    def record_payload(cls, direction: str, data: "Data", task_name: str) -> None:
+        """Counts the rows and JSON bytes of a payload received or sent by a task.
+        Measuring bytes encodes the payload once more, so it only runs while enabled."""
+        if not cls._enabled or data is None:
+            return
+
+        cls.inc(f"riveer_task_rows_{direction}_total", row_count(data), task=task_name)
+        cls.inc(f"riveer_task_bytes_{direction}_total", len(json.dumps(data)), task=task_name)
+
+    @classmethod
+    def render(cls) -> str:
+        """Returns all collected metrics in the Prometheus text format."""
+        with cls._synchronizer:
+            counters = dict(cls._counters)
+            histograms = {key: list(values) for key, values in cls._histograms.items()}
+
+        lines = []
+        for name, (metric_type, description, buckets) in _DEFINITIONS.items():
+            lines += [f"# HELP {name} {description}", f"# TYPE {name} {metric_type}"]
+
+            for (metric, labels), value in counters.items():
+                if metric == name:
+                    lines.append(f"{name}{_format_labels(labels)} {value}")
+
+            for (metric, labels), values in histograms.items():
+                if metric != name:
+                    continue
+
+                cumulative = 0
+                for bound, count in zip([*buckets, "+Inf"], values[:-2]):
+                    cumulative += count
+                    bucket_labels = _format_labels(labels, f'le="{bound}"')
+                    lines.append(f"{name}_bucket{bucket_labels} {cumulative}")
+
+                lines.append(f"{name}_sum{_format_labels(labels)} {values[-2]}")
+                lines.append(f"{name}_count{_format_labels(labels)} {values[-1]}")
+
+        return "\n".join(lines) + "\n"
+
+    @classmethod
+    def serve(cls, port: int, host: str = "0.0.0.0") -> http.server.ThreadingHTTPServer:
+        """Enables recording and serves the metrics on `/metrics` from a background thread."""
+        cls.enable()
+
+        server = http.server.ThreadingHTTPServer((host, port), _MetricsHandler)
+        threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+
+        logger.info("Serving metrics on %s:%s/metrics", host, port)
+        return server
+
+
+class _MetricsHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):  # pylint: disable=invalid-name
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+
+        body = Metrics.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *_args):
+        pass
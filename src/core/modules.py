@@ -1,43 +1,75 @@
+import ast
 import importlib
+import importlib.util
 import inspect
+import json
+import logging
+import os
 import pkgutil
 
 from core.node import Spring, Flow, Delta, BaseNode
+from core.state import state_path
 
 type NodeClass = type[BaseNode]
 
+logger = logging.getLogger("Modules")
+
+_PIPE_BASES = {"Spring": "spring", "Flow": "flow", "Delta": "delta"}
+
 
 class Modules:
     _input_config_map: dict[str, type["Spring"]] = {}
     _transform_config_map: dict[str, type["Flow"]] = {}
     _output_config_map: dict[str, type["Delta"]] = {}
 
+    # (pipe type, id) -> module name, imported once a configuration references it
+    _index: dict[tuple[str, str], str] = {}
+    _imported_modules: set[str] = set()
+
     @classmethod
     def initialize(cls):
-        """Loads the extensions and processes them."""
-        for node_cls in cls._get_extension_cls():
-            if issubclass(node_cls, Spring):
-                cls._add_node_cls(node_cls, cls._input_config_map)
-            elif issubclass(node_cls, Flow):
-                cls._add_node_cls(node_cls, cls._transform_config_map)
-            elif issubclass(node_cls, Delta):
-                cls._add_node_cls(node_cls, cls._output_config_map)
-            else:
-                raise ValueError("Invalid class provided")
+        """Indexes the extensions without importing them, so each worker only imports
+        the dependencies of the node types its configurations use."""
+        cls._index = cls._load_index()
+
+    @classmethod
+    def register(cls, node_cls: NodeClass):
+        """Makes a node class available to configurations by its id."""
+        if issubclass(node_cls, Spring):
+            cls._add_node_cls(node_cls, cls._input_config_map)
+        elif issubclass(node_cls, Flow):
+            cls._add_node_cls(node_cls, cls._transform_config_map)
+        elif issubclass(node_cls, Delta):
+            cls._add_node_cls(node_cls, cls._output_config_map)
+        else:
+            raise ValueError("Invalid class provided")
 
     @classmethod
     def get_node_cls(cls, pipe_type: str, pipe_id: str) -> NodeClass:
         """Returns the corresponding node class to the type and class id"""
-        try:
-            if pipe_type == "spring":
-                return cls._input_config_map[pipe_id]
-            if pipe_type == "flow":
-                return cls._transform_config_map[pipe_id]
-            if pipe_type == "delta":
-                return cls._output_config_map[pipe_id]
-
+        maps = {
+            "spring": cls._input_config_map,
+            "flow": cls._transform_config_map,
+            "delta": cls._output_config_map,
+        }
+        if (mapping := maps.get(pipe_type)) is None:
             raise ValueError(f"Node of type `{pipe_type}` is invalid.")
 
+        if pipe_id not in mapping and (module_name := cls._index.get((pipe_type, pipe_id))):
+            cls._import_module(module_name)
+
+        # classes the index cannot see, like indirect subclasses, require importing all
+        if pipe_id not in mapping:
+            for module_name in cls._iter_module_names():
+                try:
+                    cls._import_module(module_name)
+                except ImportError as e:
+                    logger.warning(
+                        "[%s] Skipping extension %s: %s", e.__class__.__name__, module_name, e
+                    )
+
+        try:
+            return mapping[pipe_id]
         except KeyError as e:
             raise ValueError(f"Node of name `{pipe_id}` is unknown.") from e
 
@@ -51,20 +83,93 @@ class Modules:
 
         mapping[name] = node_cls
 
-    @staticmethod
-    def _get_extension_cls():
-        """Loads all extensions from the `extensions` folder."""
+    @classmethod
+    def _import_module(cls, module_name: str):
+        """Imports an extension module and registers the node classes defined in it."""
+        if module_name in cls._imported_modules:
+            return
+
+        cls._imported_modules.add(module_name)
+        module = importlib.import_module(module_name)
+
+        for _, node_cls in inspect.getmembers(module, inspect.isclass):
+            if (
+                issubclass(node_cls, BaseNode)
+                and node_cls.__module__ == module_name
+                and len(node_cls.__abstractmethods__) == 0
+            ):
+                cls.register(node_cls)
 
+    @staticmethod
+    def _iter_module_names():
+        """Yields the names of all modules in the `extensions` folder."""
         package_module = importlib.import_module("extensions")
 
-        for _, module_name, is_pkg in pkgutil.walk_packages(
+        for module_info in pkgutil.walk_packages(
             package_module.__path__, package_module.__name__ + "."
         ):
-            if is_pkg:
+            if not module_info.ispkg:
+                yield module_info.name
+
+    @staticmethod
+    def _module_path(module_name: str) -> str:
+        return importlib.util.find_spec(module_name).origin
+
+    @classmethod
+    def _load_index(cls) -> dict[tuple[str, str], str]:
+        """Returns the index of extension classes, read from the cache in the state folder
+        unless an extension module changed since it was written."""
+        modules = {name: cls._module_path(name) for name in cls._iter_module_names()}
+        stamps = {}
+        for name, path in modules.items():
+            stat = os.stat(path)
+            stamps[name] = [stat.st_mtime_ns, stat.st_size]
+
+        cache_path = state_path("extensions.json")
+        try:
+            with open(cache_path, "r", encoding="utf-8") as f:
+                cache = json.load(f)
+
+            if cache["modules"] == stamps:
+                return {(pipe, node_id): name for pipe, node_id, name in cache["index"]}
+
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+
+        index = {}
+        for name, path in modules.items():
+            for pipe, node_id in cls._scan_module(path):
+                index[(pipe, node_id)] = name
+
+        # workers may rebuild the index concurrently, so each writes its own file first
+        temp_path = f"{cache_path}.{os.getpid()}"
+        try:
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump(
+                    {"modules": stamps, "index": [[*key, name] for key, name in index.items()]}, f
+                )
+            os.replace(temp_path, cache_path)
+
+        except OSError as e:
+            logger.warning("[%s] Failed to cache extension index: %s", e.__class__.__name__, e)
+
+        return index
+
+    @staticmethod
+    def _scan_module(path: str) -> list[tuple[str, str]]:
+        """Returns the pipe type and id of the classes directly inheriting from a node type."""
+        with open(path, "r", encoding="utf-8") as f:
+            tree = ast.parse(f.read(), path)
+
+        classes = []
+        for node in tree.body:
+            if not isinstance(node, ast.ClassDef):
                 continue
 
-            module = importlib.import_module(module_name)
+            for base in node.bases:
+                if isinstance(base, ast.Name) and base.id in _PIPE_BASES:
+                    classes.append((_PIPE_BASES[base.id], node.name.lower()))
+                elif isinstance(base, ast.Attribute) and base.attr in _PIPE_BASES:
+                    classes.append((_PIPE_BASES[base.attr], node.name.lower()))
 
-            for _, cls in inspect.getmembers(module, inspect.isclass):
-                if issubclass(cls, BaseNode) and len(cls.__abstractmethods__) == 0:
-                    yield cls
+        return classes
@@ -1,9 +1,14 @@
 from abc import ABCMeta, abstractmethod
+import threading
 import typing
 
 from celery import current_app as celery_app
+from celery.exceptions import SoftTimeLimitExceeded
 from voluptuous import Schema, Any
 
+from core.coalesce import WriteCoalescer
+from core.columnar import rows_only
+from core.spill import SpillBuffer
 from core.task import TaskWrapper
 
 if typing.TYPE_CHECKING:
@@ -16,26 +21,55 @@ if typing.TYPE_CHECKING:
 class BaseNode(metaclass=ABCMeta):
     """This class acts as the base building block for the connected nodes."""
 
+    fusable: bool = True
+    """Whether writers may run this node in their own process instead of sending a task."""
+
+    columnar: bool = False
+    """Whether the node receives columnar batches as they are instead of as documents."""
+
     def __init__(self, config: dict, use_wrapper: bool = True):
         """Registers the function as a celery task."""
         config_schema = self.config_schema().extend({"configuration": Any(dict)})
         self._config = config_schema(config)
 
+        # shared by all tasks of the node in the process
+        self.task_slots: threading.BoundedSemaphore | None = None
+        if (concurrency := self._config["configuration"].get("concurrency")) is not None:
+            self.task_slots = threading.BoundedSemaphore(concurrency)
+
         if use_wrapper:
-            self.function = TaskWrapper(self.function, self.output_ids)
+            self.function = self.wrap_function(self.function)
+
+            if not self.columnar:
+                self.function = rows_only(self.function)
+
+            self.function = TaskWrapper(
+                self.function, self.output_ids, self.fused_ids, self.time_limit, self.task_slots
+            )
 
         _func = celery_app.task(
             self.function,
             name=f"{self.node_type()}-{self.name}-node-process",
             bind=True,
+            **self.task_options(),
         )
         self.function = _func
 
+    def wrap_function(self, func: typing.Callable) -> typing.Callable:
+        """Returns the function wrapped by the layers of the node type, which run within
+        the task wrapper and receive documents unless the node is columnar."""
+        return func
+
     @property
     def output_ids(self) -> list[str]:
         """Returns the ids of the nodes that should be triggered by this node."""
         return []
 
+    @property
+    def fused_ids(self) -> list[str]:
+        """Returns the ids of the output nodes that run in the process of this node."""
+        return self._config["configuration"].get("fuse", [])
+
     @classmethod
     def id(cls) -> str:
         """Returns the id of the class created from the source."""
@@ -51,6 +85,40 @@ class BaseNode(metaclass=ABCMeta):
         """Returns the name of the created instance."""
         return self._config["configuration"]["name"]
 
+    @property
+    def queue(self) -> str:
+        """Returns the broker queue of the node's tasks, by default one per node type."""
+        return self._config["configuration"].get("queue") or f"riveer.{self.node_type()}"
+
+    @property
+    def time_limit(self) -> float | None:
+        """Returns the seconds after which in-flight work of a task is cancelled if limited."""
+        limits = self._config["configuration"].get("time_limit") or {}
+        return limits.get("soft", limits.get("hard"))
+
+    def task_options(self) -> dict:
+        """Returns the celery task options set in the `configuration` header."""
+        header = self._config["configuration"]
+        options = {"queue": self.queue}
+
+        if serializer := header.get("serializer"):
+            options["serializer"] = serializer
+        if compression := header.get("compression"):
+            options["compression"] = compression
+        if (acks_late := header.get("acks_late")) is not None:
+            options["acks_late"] = acks_late
+        if header.get("concurrency") is not None:
+            # tasks waiting for a free slot are sent back to the queue as often as needed
+            options["max_retries"] = None
+
+        limits = header.get("time_limit") or {}
+        if "soft" in limits:
+            options["soft_time_limit"] = limits["soft"]
+        if "hard" in limits:
+            options["time_limit"] = limits["hard"]
+
+        return options
+
     @classmethod
     def from_configuration(cls: "Self", config: dict) -> "Self":
         """Return an instance for a node using the provided configuration."""
@@ -95,7 +163,7 @@ class Spring(GraphWriter, metaclass=ABCMeta):
 
     @property
     def output_ids(self) -> list[str]:
-        return list(set(t["name"] for t in self._config["tasks"]))
+        return list(set(o for t in self._config["tasks"] for o in t["outputs"]))
 
 
 class Flow(GraphWriter, GraphReader, metaclass=ABCMeta):
@@ -117,3 +185,35 @@ class Flow(GraphWriter, GraphReader, metaclass=ABCMeta):
 
 class Delta(GraphReader, metaclass=ABCMeta):
     """Node element that acts as an output of the graph."""
+
+    def __init__(self, config: dict):
+        self._spill: SpillBuffer | None = None
+        super().__init__(config)
+
+    def wrap_function(self, func: typing.Callable) -> typing.Callable:
+        header = self._config["configuration"]
+
+        # merged sends which failed are spilled by each invocation on its own
+        if (coalesce := header.get("coalesce")) is not None:
+            func = WriteCoalescer(self.name, func, coalesce)
+
+        if (spill := header.get("spill")) is not None:
+            self._spill = SpillBuffer(self.name, func, spill, self.is_transient)
+            return self._spill
+
+        return func
+
+    def is_transient(self, error: Exception) -> bool:
+        """Returns whether a failed send may succeed later, e.g. after connection failures
+        or timeouts, so buffers retry it instead of failing the task."""
+        return isinstance(error, (ConnectionError, TimeoutError, SoftTimeLimitExceeded))
+
+    def open_buffers(self) -> None:
+        """Opens the buffers of the delta in the current process, after it connected."""
+        if self._spill is not None:
+            self._spill.open()
+
+    def close_buffers(self) -> None:
+        """Closes the buffers of the delta in the current process, before it shuts down."""
+        if self._spill is not None:
+            self._spill.close()
@@ -0,0 +1,93 @@
+import json
+import logging
+import os
+import threading
+import time
+import typing
+import uuid
+
+if typing.TYPE_CHECKING:
+    type Data = list | dict
+
+logger = logging.getLogger("PayloadStore")
+
+_SAMPLE_ITEMS = 16
+
+
+def estimate_size(data: typing.Any) -> int:
+    """Returns the approximate JSON size of the data, extrapolating long lists like rows or
+    columns from evenly spaced samples of their items instead of encoding all of them."""
+    if isinstance(data, list) and len(data) > _SAMPLE_ITEMS:
+        step = len(data) / _SAMPLE_ITEMS
+        sample = [data[int(i * step)] for i in range(_SAMPLE_ITEMS)]
+        return len(json.dumps(sample)) * len(data) // _SAMPLE_ITEMS
+
+    if isinstance(data, dict):
+        return 2 + sum(len(json.dumps(k)) + 2 + estimate_size(v) for k, v in data.items())
+
+    return len(json.dumps(data))
+
+
+class PayloadStore:
+    """This keeps large results in a local folder, so they are written once and
+    passed between tasks by reference instead of through the broker.
+    Pointing the folder to a `tmpfs` like `/dev/shm` keeps the payloads in shared memory."""
+
+    def __init__(self, folder: str, threshold: int, ttl: int):
+        self._folder = folder
+        self._threshold = threshold
+        self._ttl = ttl
+
+        self._last_eviction = 0.0
+        self._synchronizer = threading.Lock()
+
+        os.makedirs(self._folder, exist_ok=True)
+
+    def _path(self, reference: str) -> str:
+        return os.path.join(self._folder, f"{reference}.json")
+
+    def store(self, data: "Data") -> str | None:
+        """Writes the data and returns its reference if it exceeds the size threshold.
+        Smaller results are only estimated, so they are not encoded once more."""
+        if estimate_size(data) < self._threshold:
+            return None
+
+        encoded = json.dumps(data).encode("utf-8")
+
+        reference = uuid.uuid4().hex
+        temp_path = os.path.join(self._folder, f".{reference}.tmp")
+
+        with open(temp_path, "wb") as f:
+            f.write(encoded)
+        os.replace(temp_path, self._path(reference))
+
+        self._evict_expired()
+        return reference
+
+    def load(self, reference: str) -> "Data":
+        """Returns the data stored for a reference."""
+        try:
+            with open(self._path(reference), "rb") as f:
+                return json.loads(f.read())
+
+        except FileNotFoundError as e:
+            raise ValueError(f"Payload `{reference}` does not exist or has expired.") from e
+
+    def _evict_expired(self) -> None:
+        """Removes payloads older than the TTL, at most once per half TTL."""
+        now = time.time()
+
+        with self._synchronizer:
+            if now - self._last_eviction < self._ttl / 2:
+                return
+            self._last_eviction = now
+
+        for entry in os.scandir(self._folder):
+            try:
+                if now - entry.stat().st_mtime > self._ttl:
+                    os.remove(entry.path)
+            except FileNotFoundError:
+                # evicted concurrently by another worker
+                continue
+
+        logger.debug("Evicted expired payloads from %s", self._folder)
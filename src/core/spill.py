@@ -0,0 +1,502 @@
+import fcntl
+import json
+import logging
+import mmap
+import os
+import struct
+import threading
+import typing
+import zlib
+
+from core.columnar import row_count
+from core.metrics import Metrics
+from core.state import state_path
+
+if typing.TYPE_CHECKING:
+    type Data = list | dict
+
+logger = logging.getLogger("SpillBuffer")
+
+_RECORD = struct.Struct("<II")  # length and CRC32 of the JSON payload
+_CURSOR = struct.Struct("<QQ")  # segment and offset of the first unsent record
+_SUFFIX = ".log"
+
+
+class PartialSendError(Exception):
+    """Raised by a delta whose sink accepted only some of the documents. It keeps the
+    documents which failed transiently and may be sent again, and those which failed for good."""
+
+    def __init__(self, message: str, transient: list, failed: list):
+        super().__init__(message)
+        self.transient = transient
+        self.failed = failed
+
+
+def is_transient_status(status: typing.Any) -> bool:
+    """Returns whether an HTTP status is a rejection or a server error, which may pass."""
+    return isinstance(status, int) and (status == 429 or status >= 500)
+
+
+class SpillLog:
+    """This appends JSON payloads to numbered segment files of a folder, which are read
+    through memory mapping from the cursor of the first unsent record. Sent segments are
+    deleted, and once the unsent records exceed `max_bytes`, either the oldest segments or
+    new records are dropped. The folder must be claimed by a single process.
+
+    Records are only flushed to the system, so they survive crashes of the process but not
+    of the host, unless `fsync` is set at the cost of a disk sync per record."""
+
+    def __init__(
+        self,
+        name: str,
+        folder: str,
+        max_bytes: int,
+        segment_bytes: int,
+        eviction: str,
+        fsync: bool = False,
+    ):
+        self.name = name
+        self.folder = folder
+        self._max_bytes = max_bytes
+        self._segment_bytes = segment_bytes
+        self._eviction = eviction
+        self._fsync = fsync
+        self._synchronizer = threading.Lock()
+
+        self._segments = sorted(
+            int(entry.removesuffix(_SUFFIX))
+            for entry in os.listdir(folder)
+            if entry.endswith(_SUFFIX)
+        )
+        self._sizes = {segment: os.path.getsize(self._path(segment)) for segment in self._segments}
+
+        try:
+            with open(os.path.join(folder, "cursor"), "rb") as f:
+                self._cursor = _CURSOR.unpack(f.read())
+        except (FileNotFoundError, struct.error):
+            self._cursor = (0, 0)
+
+        if not self._segments or self._cursor[0] < self._segments[0]:
+            self._cursor = (self._segments[0] if self._segments else self._cursor[0], 0)
+
+        # a record torn by a crash ends the previous segment instead of preceding new ones
+        self._file: typing.BinaryIO | None = None
+        self._roll()
+
+    def _path(self, segment: int) -> str:
+        return os.path.join(self.folder, f"{segment:016d}{_SUFFIX}")
+
+    def _roll(self) -> None:
+        """Appends to a new segment unless the last one is still empty."""
+        if not self._segments or self._sizes[self._segments[-1]]:
+            segment = self._segments[-1] + 1 if self._segments else self._cursor[0]
+            self._segments.append(segment)
+            self._sizes[segment] = 0
+
+        if self._file is not None:
+            self._file.close()
+        self._file = open(self._path(self._segments[-1]), "ab")
+
+    @property
+    def pending_bytes(self) -> int:
+        """Returns the size of the records which were not sent yet."""
+        return sum(self._sizes.values()) - self._cursor[1]
+
+    @property
+    def empty(self) -> bool:
+        segment, offset = self._cursor
+        return segment == self._segments[-1] and offset >= self._sizes[segment]
+
+    def append(self, data: "Data") -> bool:
+        """Writes the data as a new record and returns whether it was kept."""
+        payload = json.dumps(data, separators=(",", ":")).encode("utf-8")
+        record = _RECORD.pack(len(payload), zlib.crc32(payload)) + payload
+
+        with self._synchronizer:
+            if not self._reserve(len(record)):
+                return False
+
+            if self._sizes[self._segments[-1]] + len(record) > self._segment_bytes:
+                self._roll()
+
+            self._file.write(record)
+            self._file.flush()
+            if self._fsync:
+                os.fsync(self._file.fileno())
+            self._sizes[self._segments[-1]] += len(record)
+
+        return True
+
+    def _reserve(self, size: int) -> bool:
+        """Evicts the oldest segments until a record of the size fits, unless the policy
+        drops the newest records instead. Must hold the lock."""
+        while self.pending_bytes + size > self._max_bytes:
+            if self._eviction == "newest" or size > self._max_bytes:
+                return False
+
+            if len(self._segments) == 1:
+                self._roll()
+
+            segment = self._segments.pop(0)
+            unsent = self._sizes.pop(segment)
+            if segment == self._cursor[0]:
+                unsent -= self._cursor[1]
+                self._cursor = (self._segments[0], 0)
+
+            os.remove(self._path(segment))
+            Metrics.inc("riveer_spill_evicted_bytes_total", unsent, node=self.name)
+            logger.warning("Evicted %s unsent bytes from spill folder %s", unsent, self.folder)
+
+        return True
+
+    def read(self, max_items: int) -> tuple[list, tuple[int, int]]:
+        """Returns the items of the unsent records, at least one record and otherwise up to
+        `max_items`, and the position after them to commit once they were sent."""
+        items = []
+
+        with self._synchronizer:
+            segment, offset = self._cursor
+
+            while len(items) < max_items:
+                size = self._sizes[segment]
+                if offset >= size:
+                    if segment == self._segments[-1]:
+                        break
+
+                    segment, offset = self._segments[self._segments.index(segment) + 1], 0
+                    continue
+
+                with (
+                    open(self._path(segment), "rb") as f,
+                    mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ) as view,
+                ):
+                    while offset < size and len(items) < max_items:
+                        start = offset + _RECORD.size
+                        length, checksum = (0, 0)
+                        if start <= size:
+                            length, checksum = _RECORD.unpack_from(view, offset)
+                        payload = view[start : start + length]
+
+                        # records torn by a crash are followed by a new segment
+                        if start > size or len(payload) < length or zlib.crc32(payload) != checksum:
+                            logger.warning("Skipping torn records of %s", self._path(segment))
+                            offset = size
+                            break
+
+                        data = json.loads(payload)
+                        items += data if isinstance(data, list) else [data]
+                        offset = start + length
+
+        return items, (segment, offset)
+
+    def commit(self, position: tuple[int, int]) -> None:
+        """Moves the cursor behind sent records and deletes the segments before it."""
+        with self._synchronizer:
+            self._cursor = max(self._cursor, position)
+
+            while self._segments[0] < self._cursor[0]:
+                os.remove(self._path(self._segments[0]))
+                del self._sizes[self._segments.pop(0)]
+
+            self._write_cursor()
+
+    def _write_cursor(self) -> None:
+        temp_path = os.path.join(self.folder, f".cursor.{os.getpid()}")
+        with open(temp_path, "wb") as f:
+            f.write(_CURSOR.pack(*self._cursor))
+        os.replace(temp_path, os.path.join(self.folder, "cursor"))
+
+    def close(self) -> None:
+        with self._synchronizer:
+            self._file.close()
+            self._write_cursor()
+
+
+def _claim(folder: str) -> int | None:
+    """Returns the locked file descriptor of the folder if no other process holds it."""
+    os.makedirs(folder, exist_ok=True)
+    lock_path = os.path.join(folder, "lock")
+    fd = os.open(lock_path, os.O_CREAT | os.O_RDWR, 0o644)
+
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+        # the holder removed the folder after draining it while the lock was acquired
+        if os.fstat(fd).st_ino != os.stat(lock_path).st_ino:
+            raise BlockingIOError
+    except (BlockingIOError, FileNotFoundError):
+        os.close(fd)
+        return None
+
+    return fd
+
+
+def _remove(folder: str, fd: int) -> None:
+    """Deletes a drained folder and then releases its lock."""
+    for entry in os.scandir(folder):
+        if entry.name != "lock":
+            os.remove(entry.path)
+
+    os.remove(os.path.join(folder, "lock"))
+    os.rmdir(folder)
+    os.close(fd)
+
+
+class SpillBuffer:
+    """This sends the payloads of a delta, but keeps them in a local `SpillLog` while its sink
+    is unavailable or a backlog is left, so the task succeeds without holding them in memory.
+    Only errors deemed `transient` by the delta are spilled, others fail the task. A thread
+    drains the log in batches of up to `drain_items` and retries with exponential backoff.
+
+    If the delta raises a `PartialSendError`, only the failed documents are spilled, so sent
+    ones are not sent twice. A batch failing with other errors `max_attempts` times in a row is
+    split in halves until the failing rows are found, which are moved to the dead letters.
+
+    Each process claims its own numbered folder by a lock. Folders of processes which are gone,
+    e.g. after the worker was restarted with fewer processes, are adopted one at a time by idle
+    processes, so they are drained in parallel, and deleted once drained."""
+
+    def __init__(
+        self,
+        name: str,
+        func: typing.Callable,
+        config: dict,
+        transient: typing.Callable[[Exception], bool],
+    ):
+        self._name = name
+        self._func = func
+        self._config = config
+        self._transient = transient
+
+        self._log: SpillLog | None = None
+        self._dead: SpillLog | None = None
+        self._orphans: list[tuple[SpillLog, int]] = []
+        self._locks: list[int] = []
+        self._pid: int | None = None
+
+        self._thread: threading.Thread | None = None
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._synchronizer = threading.Lock()
+
+    def _open_log(self, folder: str) -> SpillLog:
+        return SpillLog(
+            self._name,
+            folder,
+            self._config["max_bytes"],
+            self._config["segment_bytes"],
+            self._config["eviction"],
+            self._config["fsync"],
+        )
+
+    @property
+    def _root(self) -> str:
+        return os.path.dirname(state_path("spill", self._name, "lock"))
+
+    def open(self) -> None:
+        """Claims a folder and starts draining it once in the current process, as forked
+        processes inherit neither the locks nor the thread of their parent."""
+        with self._synchronizer:
+            if self._pid == os.getpid():
+                return
+
+            root, slot = self._root, 0
+            while (fd := _claim(os.path.join(root, str(slot)))) is None:
+                slot += 1
+            self._log, self._locks = self._open_log(os.path.join(root, str(slot))), [fd]
+
+            # dead letters are kept apart, so drained folders can be removed
+            dead_folder = os.path.join(root, "dead", str(slot))
+            os.makedirs(dead_folder, exist_ok=True)
+            self._dead = self._open_log(dead_folder)
+
+            self._orphans = []
+            self._pid = os.getpid()
+
+            self._stopped = threading.Event()
+            self._thread = threading.Thread(
+                target=self._drain, name=f"spill-{self._name}", daemon=True
+            )
+            self._thread.start()
+
+    def close(self) -> None:
+        """Stops draining and releases the folders claimed by the current process."""
+        with self._synchronizer:
+            if self._pid != os.getpid():
+                return
+            self._pid = None
+
+        # the thread releases drained folders under the lock itself
+        self._stopped.set()
+        self._wakeup.set()
+        self._thread.join()
+
+        with self._synchronizer:
+            for log, fd in [(self._log, self._locks[0]), *self._orphans]:
+                log.close()
+                os.close(fd)
+
+            self._dead.close()
+
+            self._orphans.clear()
+
+        logger.info("Closed spill buffer of delta `%s`", self._name)
+
+    def _is_transient(self, error: Exception) -> bool:
+        if isinstance(error, PartialSendError):
+            return not error.failed
+
+        return self._transient(error)
+
+    def __call__(self, data: "Data", *args) -> None:
+        self.open()
+
+        # new payloads queue behind the backlog, so it is sent in order
+        if self._log.empty:
+            try:
+                return self._func(data, *args)
+
+            except PartialSendError as e:
+                if e.transient:
+                    self._spill(e.transient, e)
+                if e.failed:
+                    raise PartialSendError(
+                        f"{len(e.failed)} document(s) of delta `{self._name}` failed: {e}",
+                        [],
+                        e.failed,
+                    ) from e
+                return None
+
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                if not self._transient(e):
+                    raise
+
+                self._spill(data, e)
+                return None
+
+        self._spill(data)
+        return None
+
+    def _spill(self, data: "Data", error: Exception | None = None) -> None:
+        if error is not None:
+            logger.warning(
+                "[%s] Spilling %s row(s) of delta `%s` to disk: %s",
+                *(error.__class__.__name__, row_count(data), self._name, str(error)),
+            )
+
+        if not self._log.append(data):
+            raise OverflowError(f"Spill buffer of delta `{self._name}` is full.")
+
+        Metrics.inc("riveer_spill_rows_total", row_count(data), node=self._name)
+        self._wakeup.set()
+
+    def _dead_letter(self, items: list, error: Exception) -> None:
+        """Moves items which cannot be sent to the dead letters, with the reason."""
+        logger.error(
+            "[%s] Delta `%s` failed to send %s spilled row(s), moving them to dead letters: %s",
+            *(error.__class__.__name__, self._name, len(items), str(error)),
+        )
+
+        if not self._dead.append({"error": f"{error.__class__.__name__}: {error}", "rows": items}):
+            logger.error("Dead letters of delta `%s` are full, dropping the rows", self._name)
+
+        Metrics.inc("riveer_spill_dead_rows_total", len(items), node=self._name)
+
+    def _deliver(self, items: list, isolate: bool) -> tuple[list, Exception | None]:
+        """Sends the items and returns those left to retry with their error. When isolating,
+        items failing with errors which are not transient are split in halves until each
+        failing one is moved to the dead letters."""
+        try:
+            self._func(items)
+            return [], None
+
+        except PartialSendError as e:
+            # the sink already named the failing documents
+            if isolate and e.failed:
+                self._dead_letter(e.failed, e)
+                return self._deliver(e.transient, True) if e.transient else ([], None)
+
+            return e.transient + e.failed, e
+
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            if not isolate or self._transient(e):
+                return items, e
+
+            if len(items) == 1:
+                self._dead_letter(items, e)
+                return [], None
+
+        middle = len(items) // 2
+        left, error = self._deliver(items[:middle], True)
+        if error is not None:
+            return left + items[middle:], error
+
+        return self._deliver(items[middle:], True)
+
+    def _adopt(self) -> SpillLog | None:
+        """Claims a folder left by a stopped process which holds records, deleting empty ones.
+        Only one is adopted at a time, so other idle processes adopt the remaining ones."""
+        for entry in os.scandir(self._root):
+            if not (entry.is_dir() and entry.name.isdigit()) or entry.path == self._log.folder:
+                continue
+            if (fd := _claim(entry.path)) is None:
+                continue
+
+            log = self._open_log(entry.path)
+            if log.empty:
+                log.close()
+                _remove(entry.path, fd)
+                continue
+
+            with self._synchronizer:
+                self._orphans.append((log, fd))
+
+            logger.info("Delta `%s` adopted spill folder %s", self._name, entry.path)
+            return log
+
+        return None
+
+    def _drain(self) -> None:
+        """Sends the records of the adopted folders and then the own folder, and adopts
+        another folder once all of them are empty. Sent parts of a batch are not sent again."""
+        interval, attempts = self._config["retry_interval"], 0
+        log, pending, position, count = None, [], None, 0
+
+        while not self._stopped.is_set():
+            if position is None:
+                logs = [log for log, _ in self._orphans] + [self._log]
+                log = next((log for log in logs if not log.empty), None)
+
+                # idle processes look for folders of stopped processes from time to time
+                if log is None and (log := self._adopt()) is None:
+                    self._wakeup.wait(self._config["max_interval"])
+                    self._wakeup.clear()
+                    continue
+
+                pending, position = log.read(self._config["drain_items"])
+                count = len(pending)
+
+            if pending:
+                pending, error = self._deliver(pending, attempts >= self._config["max_attempts"])
+
+                if error is not None:
+                    attempts += not self._is_transient(error)
+                    logger.warning(
+                        "[%s] Delta `%s` failed to send spilled rows, retrying in %ss: %s",
+                        *(error.__class__.__name__, self._name, interval, str(error)),
+                    )
+                    self._stopped.wait(interval)
+                    interval = min(self._config["max_interval"], interval * 2)
+                    continue
+
+            log.commit(position)
+            position, attempts, interval = None, 0, self._config["retry_interval"]
+            Metrics.inc("riveer_spill_drained_rows_total", count, node=self._name)
+
+            # drained folders are deleted, so they are not scanned again
+            if log is not self._log and log.empty:
+                with self._synchronizer:
+                    fd = next(fd for orphan, fd in self._orphans if orphan is log)
+                    self._orphans.remove((log, fd))
+                    log.close()
+                    _remove(log.folder, fd)
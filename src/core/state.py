@@ -0,0 +1,63 @@
+import json
+import os
+import sqlite3
+import threading
+import typing
+
+
+def state_path(*parts: str) -> str:
+    """Returns a path inside the local state folder and creates its parent folders."""
+    path = os.path.join(os.getenv("RIVEER_STATE", "./state"), *parts)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    return path
+
+
+class StateStore:
+    """This persists small JSON values of nodes between runs in a local SQLite file."""
+
+    _connection: sqlite3.Connection | None = None
+    _connection_pid: int | None = None
+    _synchronizer = threading.Lock()
+
+    @classmethod
+    def _get_connection(cls) -> sqlite3.Connection:
+        """Returns the connection of this process, opening it on first use."""
+        if cls._connection is None or cls._connection_pid != os.getpid():
+            cls._connection = sqlite3.connect(
+                state_path("riveer.sqlite"),
+                timeout=30,
+                check_same_thread=False,
+                isolation_level=None,
+            )
+            cls._connection.execute(
+                "CREATE TABLE IF NOT EXISTS node_state ("
+                "namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, "
+                "PRIMARY KEY (namespace, key))"
+            )
+            cls._connection_pid = os.getpid()
+
+        return cls._connection
+
+    @classmethod
+    def get(cls, namespace: str, key: str, default: typing.Any = None) -> typing.Any:
+        """Returns the stored value or the default if nothing was stored yet."""
+        with cls._synchronizer:
+            row = (
+                cls._get_connection()
+                .execute(
+                    "SELECT value FROM node_state WHERE namespace = ? AND key = ?",
+                    (namespace, key),
+                )
+                .fetchone()
+            )
+
+        return default if row is None else json.loads(row[0])
+
+    @classmethod
+    def set(cls, namespace: str, key: str, value: typing.Any) -> None:
+        """Stores a JSON serializable value, replacing the previous one."""
+        with cls._synchronizer:
+            cls._get_connection().execute(
+                "INSERT OR REPLACE INTO node_state (namespace, key, value) VALUES (?, ?, ?)",
+                (namespace, key, json.dumps(value)),
+            )
@@ -1,30 +1,112 @@
 import logging
+import random
+import threading
+import time
 import typing
 
+from core.deadline import Deadline
 from core.graph import NodeGraph
+from core.metrics import Metrics
+from core.trace import Trace, TraceEnvelope
 
 logger = logging.getLogger("NodeTask")
 
+SLOT_RETRY_DELAY = 1.0
 
-def _task_wrapper(func: typing.Callable, output_ids: list[str]) -> typing.Callable:
-    """This wraps the function to send the result to the next node."""
 
-    def inner(task, task_data, *args) -> None:
+def _task_wrapper(
+    func: typing.Callable,
+    output_ids: list[str],
+    fused_ids: typing.Container[str] = (),
+    time_limit: float | None = None,
+    slots: threading.Semaphore | None = None,
+) -> typing.Callable:
+    """This wraps the function to send the result to the next node.
+    Tasks which are not triggered by another node, like cron tasks, start a new trace.
+    With a time limit, the node's registered cancel callbacks run once it expires.
+    With slots, tasks finding all of them taken are sent back to their queue after about
+    `SLOT_RETRY_DELAY` seconds instead of blocking a worker, while fused calls wait."""
+
+    def inner(
+        task,
+        task_data,
+        *args,
+        payload_ref: str | None = None,
+        trace: TraceEnvelope | None = None,
+    ) -> None:
+        start = time.perf_counter()
+
+        if trace is None:
+            trace = Trace.start(task.name)
+        else:
+            queue_wait = time.time() - trace["sent"]
+            Metrics.observe("riveer_queue_wait_seconds", queue_wait, task=task.name)
+
+        token = Metrics.enter_task(task.name)
+        trace_token = Trace.enter(trace)
+
+        # fused nodes without a limit of their own inherit the deadline of the caller
+        deadline = None if time_limit is None else Deadline(task.name, time_limit)
+        deadline_token = None if deadline is None else Deadline.enter(deadline)
+
         try:
             logger.info("Running Spring task %s", task.name)
 
+            if payload_ref is not None:
+                task_data = NodeGraph.load_payload(payload_ref)
+
+            if not isinstance(task_data, str):
+                Metrics.record_payload("in", task_data, task.name)
+
             result = func(task_data, *args)
 
             if result is not None:
-                NodeGraph.send_result(result, output_ids)
+                NodeGraph.send_result(result, output_ids, fused_ids)
+
+            if not output_ids:
+                # terminal nodes mark the end of the pipeline run
+                latency = time.time() - trace["origin"]
+                Metrics.observe(
+                    "riveer_pipeline_latency_seconds",
+                    latency,
+                    source=trace["source"],
+                    task=task.name,
+                )
 
         except Exception as e:
+            Metrics.inc("riveer_task_failures_total", task=task.name)
+            if deadline is not None and deadline.expired:
+                Metrics.inc("riveer_task_timeouts_total", task=task.name)
+
             logger.error(
                 "[%s] Task %s failed to execute because: %s",
                 *(e.__class__.__name__, task.name, str(e)),
             )
 
-    return inner
+        finally:
+            duration = time.perf_counter() - start
+            Metrics.observe("riveer_task_duration_seconds", duration, task=task.name)
+            Metrics.exit_task(token)
+            Trace.exit(trace_token)
+
+            if deadline is not None:
+                deadline.finish()
+                Deadline.exit(deadline_token)
+
+    if slots is None:
+        return inner
+
+    def limited(task, task_data, *args, **kwargs) -> None:
+        # fused calls have no queue to return to, so only they wait for a free slot
+        if not slots.acquire(blocking=task.request.called_directly):
+            raise task.retry(countdown=SLOT_RETRY_DELAY * random.uniform(0.5, 1.5))
+
+        try:
+            return inner(task, task_data, *args, **kwargs)
+        finally:
+            slots.release()
+
+    return limited
 
 
 TaskWrapper = _task_wrapper
@@ -0,0 +1,40 @@
+import contextvars
+import time
+import uuid
+
+type TraceEnvelope = dict[str, str | float]
+
+_current_trace: contextvars.ContextVar[TraceEnvelope | None] = contextvars.ContextVar(
+    "riveer_trace", default=None
+)
+
+
+class Trace:
+    """This stamps each pipeline run with an id and the time it originated, and is
+    passed along with the data on every hop through the graph.
+    The envelope holds the `id`, originating `source` task, `origin` and last `sent` time."""
+
+    @staticmethod
+    def start(source: str) -> TraceEnvelope:
+        """Returns the envelope of a new pipeline run started by the source task."""
+        now = time.time()
+        return {"id": uuid.uuid4().hex, "source": source, "origin": now, "sent": now}
+
+    @staticmethod
+    def stamp_sent(trace: TraceEnvelope) -> TraceEnvelope:
+        """Returns a copy of the envelope marked as sent now."""
+        return trace | {"sent": time.time()}
+
+    @staticmethod
+    def enter(trace: TraceEnvelope) -> contextvars.Token:
+        """Marks the pipeline run handled in the current context."""
+        return _current_trace.set(trace)
+
+    @staticmethod
+    def exit(token: contextvars.Token) -> None:
+        _current_trace.reset(token)
+
+    @staticmethod
+    def current() -> TraceEnvelope | None:
+        """Returns the envelope of the pipeline run handled in the current context if any."""
+        return _current_trace.get()
@@ -1,19 +1,27 @@
+import gzip
 import json
 import logging
+import typing
+from concurrent.futures import ThreadPoolExecutor
+
 import requests
+from requests.adapters import HTTPAdapter
 from requests.auth import HTTPBasicAuth
 
-from voluptuous import Schema, Coerce, Optional, Any
+from voluptuous import Schema, All, Coerce, Optional, Any, Range
 
-from core.app import EnvStr, LowerVal
+from core.app import AppController, EnvStr, LowerVal
+from core.deadline import Deadline
 from core.node import Delta
+from core.spill import PartialSendError, is_transient_status
 
 
 class BasicHTTP(Delta):
     def __init__(self, config):
         super().__init__(config)
 
-        self._session = requests.Session()
+        self._session: requests.Session | None = None
+        self._executor: ThreadPoolExecutor | None = None
 
     @staticmethod
     def config_schema() -> "Schema":
@@ -32,16 +40,28 @@ class BasicHTTP(Delta):
                     Optional("allowed_responses", default=[200]): [int],
                     Optional("ping_on_start", default=False): Coerce(bool),
                     Optional("allowed_ping_responses", default=[200]): [int],
+                    Optional("pool_maxsize", default=10): All(Coerce(int), Range(min=1)),
                 },
                 "processing": {
                     "payload_format": Any("json"),
                     Optional("timeout", default=60): Coerce(int),
+                    Optional("compress", default=False): Coerce(bool),
+                    Optional("max_items", default=None): Any(None, All(Coerce(int), Range(min=1))),
+                    Optional("max_body_bytes", default=None): Any(
+                        None, All(Coerce(int), Range(min=1))
+                    ),
+                    Optional("concurrency", default=1): All(Coerce(int), Range(min=1)),
                 },
             }
         )
 
     def connect(self) -> None:
         config = self._config["connection"]
+        self._session = requests.Session()
+
+        adapter = HTTPAdapter(pool_maxsize=AppController.process_share(config["pool_maxsize"]))
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
 
         if auth := config["auth"]:
             self._session.auth = HTTPBasicAuth(auth["username"], auth["password"])
@@ -52,30 +72,133 @@ class BasicHTTP(Delta):
         if config["ping_on_start"]:
             ...
 
-    def function(self, data: list, *args) -> None:
-        payload = json.dumps(data)
+        # created once per process, as tasks and buffer threads send concurrently
+        if (concurrency := self._config["processing"]["concurrency"]) > 1:
+            self._executor = ThreadPoolExecutor(concurrency, thread_name_prefix=f"http-{self.name}")
+
+    def is_transient(self, error: Exception) -> bool:
+        if isinstance(error, (requests.ConnectionError, requests.Timeout)):
+            return True
+        if isinstance(error, requests.HTTPError) and error.response is not None:
+            return is_transient_status(error.response.status_code)
+
+        return super().is_transient(error)
+
+    def _iter_bodies(self, data: list | dict) -> typing.Iterator[tuple[list | dict, str]]:
+        """Yields the JSON request bodies with their items, splitting lists by `max_items`
+        and `max_body_bytes`."""
+        proc_conf = self._config["processing"]
+        max_items, max_bytes = proc_conf["max_items"], proc_conf["max_body_bytes"]
+
+        if not isinstance(data, list) or (max_items is None and max_bytes is None):
+            yield data, json.dumps(data)
+            return
+
+        batch, encoded_batch, batch_bytes = [], [], 2
+        for item in data:
+            encoded = json.dumps(item)
+
+            # an item larger than the limit is still sent on its own
+            if batch and (
+                (max_items is not None and len(batch) >= max_items)
+                or (max_bytes is not None and batch_bytes + len(encoded) + 1 > max_bytes)
+            ):
+                yield batch, f"[{','.join(encoded_batch)}]"
+                batch, encoded_batch, batch_bytes = [], [], 2
+
+            batch.append(item)
+            encoded_batch.append(encoded)
+            batch_bytes += len(encoded) + 1
 
+        if batch:
+            yield batch, f"[{','.join(encoded_batch)}]"
+
+    def _send(self, body: str, deadline: Deadline | None = None) -> None:
         conn_conf = self._config["connection"]
         proc_conf = self._config["processing"]
 
-        with self._session as session:
-            response = session.request(
-                conn_conf["method"],
-                conn_conf["endpoint"],
-                data=payload,
-                timeout=proc_conf["timeout"],
+        headers = None
+        if proc_conf["compress"]:
+            body = gzip.compress(body.encode("utf-8"))
+            headers = {"Content-Encoding": "gzip"}
+
+        response = self._session.request(
+            conn_conf["method"],
+            conn_conf["endpoint"],
+            data=body,
+            headers=headers,
+            timeout=Deadline.timeout(proc_conf["timeout"], deadline),
+        )
+
+        if response.status_code not in conn_conf["allowed_responses"]:
+            logging.error(
+                "HTTP request failed with status code %s: %s",
+                response.status_code,
+                response.text,
             )
 
-            if response.status_code not in conn_conf["allowed_responses"]:
-                logging.error(
-                    "HTTP request failed with status code %s: %s",
-                    response.status_code,
-                    response.text,
-                )
+            response.status_code = max(400, response.status_code)
+            response.raise_for_status()
 
-                response.status_code = max(400, response.status_code)
-                response.raise_for_status()
+    def function(self, data: list, *args) -> None:
+        bodies = self._iter_bodies(data)
+        concurrency = self._config["processing"]["concurrency"]
+        errors, sent = [], 0
+
+        if concurrency == 1:
+            for items, body in bodies:
+                # once the endpoint is unavailable, the remaining bodies are kept unsent
+                if errors and (errors[-1][1] is None or self.is_transient(errors[-1][1])):
+                    errors.append((items, None))
+                    continue
+
+                try:
+                    self._send(body)
+                    sent += 1
+                except Exception as e:  # pylint: disable=broad-exception-caught
+                    errors.append((items, e))
+
+        else:
+            # executor threads do not share the task's context, so the deadline is passed on
+            deadline = Deadline.current()
+            futures = [
+                (items, self._executor.submit(self._send, body, deadline))
+                for items, body in bodies
+            ]
+
+            for items, future in futures:
+                try:
+                    future.result()
+                    sent += 1
+                except Exception as e:  # pylint: disable=broad-exception-caught
+                    errors.append((items, e))
+
+        if errors:
+            self._raise_errors(data, sent, errors)
+
+    def _raise_errors(
+        self, data: list, sent: int, errors: list[tuple[list, Exception | None]]
+    ) -> None:
+        """Raises a `PartialSendError` with the items of the failed and unsent bodies, which
+        have no error, split by whether they may be sent again, so accepted bodies are not sent
+        twice. If no body was sent and all failed alike, the error itself is raised."""
+        error = errors[0][1]
+        transient, failed = [], []
+        for items, e in errors:
+            (transient if e is None or self.is_transient(e) else failed).extend(items)
+
+        if not sent and not (transient and failed):
+            raise error
+
+        raise PartialSendError(
+            f"{len(transient) + len(failed)} of {len(data)} item(s) failed to send: {error}",
+            transient,
+            failed,
+        ) from error
 
     def shutdown(self) -> None:
-        self._session.close()
+        if self._executor is not None:
+            self._executor.shutdown()
+        if self._session is not None:
+            self._session.close()
         logging.info("Closed HTTP sessions for delta %s.", self.name)
@@ -1,12 +1,117 @@
+import collections
+import json
 import logging
 import threading
+import time
+import typing
+from concurrent.futures import ThreadPoolExecutor
 
 from opensearchpy import OpenSearch as OpenSearchConn
-from opensearchpy.helpers import bulk
-from voluptuous import Schema, Coerce, Optional
+from opensearchpy.exceptions import ConnectionError as ClientConnectionError
+from opensearchpy.exceptions import ConnectionTimeout, TransportError
+from opensearchpy.helpers import expand_action, parallel_bulk, streaming_bulk
+from voluptuous import Schema, All, Any, Coerce, Length, Optional, Range
 
-from core.app import EnvStr
+from core.app import AppController, EnvStr
+from core.deadline import Deadline
 from core.node import Delta
+from core.spill import PartialSendError, is_transient_status
+
+# fields of a document which opensearchpy moves from the source into the bulk action line
+_META_FIELDS = frozenset(
+    {
+        "_id",
+        "_index",
+        "_op_type",
+        "_parent",
+        "_percolate",
+        "_routing",
+        "_timestamp",
+        "_version",
+        "_version_type",
+        "_if_seq_no",
+        "_if_primary_term",
+        "_retry_on_conflict",
+        "routing",
+        "version",
+        "version_type",
+        "if_seq_no",
+        "if_primary_term",
+        "retry_on_conflict",
+        "parent",
+        "pipeline",
+    }
+)
+
+
+def split_meta(document: dict) -> tuple[dict, dict]:
+    """Returns the bulk metadata of a document like `_id` and its source without them.
+    Documents without metadata are returned as they are instead of being copied."""
+    if _META_FIELDS.isdisjoint(document):
+        return {}, document
+
+    meta, source = {}, {}
+    for key, value in document.items():
+        (meta if key in _META_FIELDS else source)[key] = value
+
+    return meta, source
+
+
+def document_id(document: dict, fields: list[str]) -> str:
+    """Returns the `_id` of a document built from the values of its id fields."""
+    if len(fields) == 1:
+        return str(document.get(fields[0]))
+
+    return json.dumps([document.get(f) for f in fields], separators=(",", ":"), default=str)
+
+
+def is_failure(item: dict) -> bool:
+    """Returns whether the item of a bulk response failed. Deleting a missing document
+    succeeds, as it is gone either way."""
+    op_type, result = next(iter(item.items()))
+    status = result.get("status", 500)
+
+    return not (200 <= status < 300 or (op_type == "delete" and status == 404))
+
+
+class AdaptiveBulkController:
+    """Adapts the chunk size and concurrency of bulk requests AIMD-style.
+    After each round of concurrent requests both grow additively if all were fast and
+    accepted, and are halved once the cluster rejected documents or responded slower
+    than the target latency."""
+
+    def __init__(
+        self,
+        chunk_size: int,
+        min_chunk_size: int,
+        max_chunk_size: int,
+        max_concurrency: int,
+        target_latency: float,
+    ):
+        self._min_chunk_size = min_chunk_size
+        self._max_chunk_size = max_chunk_size
+        self._max_concurrency = max_concurrency
+        self._target_latency = target_latency
+        self._chunk_step = max(1, chunk_size // 4)
+
+        self.chunk_size = min(max(chunk_size, min_chunk_size), max_chunk_size)
+        self.concurrency = 1
+        self._synchronizer = threading.Lock()
+
+    def limits(self) -> tuple[int, int]:
+        """Returns the current chunk size and number of concurrent requests."""
+        with self._synchronizer:
+            return self.chunk_size, self.concurrency
+
+    def record(self, latency: float, rejected: int) -> None:
+        """Adapts the limits to the slowest latency and rejected documents of a round."""
+        with self._synchronizer:
+            if rejected or latency > self._target_latency:
+                self.chunk_size = max(self._min_chunk_size, self.chunk_size // 2)
+                self.concurrency = max(1, self.concurrency // 2)
+            else:
+                self.chunk_size = min(self._max_chunk_size, self.chunk_size + self._chunk_step)
+                self.concurrency = min(self._max_concurrency, self.concurrency + 1)
 
 
 class OpenSearch(Delta):
@@ -14,7 +119,27 @@ class OpenSearch(Delta):
         super().__init__(config)
 
         self._connection: OpenSearchConn | None = None
-        self._synchronizer = threading.Lock()
+
+        proc_conf = self._config["processing"]
+        self._controller = AdaptiveBulkController(
+            chunk_size=proc_conf["chunk_size"],
+            min_chunk_size=proc_conf["min_chunk_size"],
+            max_chunk_size=proc_conf["max_chunk_size"],
+            max_concurrency=proc_conf["thread_count"],
+            target_latency=proc_conf["target_latency"],
+        )
+        self._executor: ThreadPoolExecutor | None = None
+
+        if proc_conf["op_field"] is not None and proc_conf["id_fields"] is None:
+            raise ValueError(f"Delta `{self.name}` needs `id_fields` to apply `op_field`.")
+
+    def is_transient(self, error: Exception) -> bool:
+        if isinstance(error, ClientConnectionError):
+            return True
+        if isinstance(error, TransportError):
+            return is_transient_status(error.status_code)
+
+        return super().is_transient(error)
 
     @staticmethod
     def config_schema() -> "Schema":
@@ -30,10 +155,25 @@ class OpenSearch(Delta):
                     Optional("use_ssl", default=True): Coerce(bool),
                     Optional("verify_certs", default=True): Coerce(bool),
                     Optional("http_compress", default=True): Coerce(bool),
+                    Optional("pool_maxsize", default=10): All(Coerce(int), Range(min=1)),
                 },
                 "processing": {
                     "index": EnvStr(),
                     Optional("timeout", default=60): EnvStr(Coerce(int)),
+                    Optional("mode", default="bulk"): Any("bulk", "parallel", "adaptive"),
+                    Optional("chunk_size", default=500): All(Coerce(int), Range(min=1)),
+                    Optional("max_chunk_bytes", default=100 * 1024 * 1024): All(
+                        Coerce(int), Range(min=1)
+                    ),
+                    Optional("thread_count", default=4): All(Coerce(int), Range(min=1)),
+                    Optional("min_chunk_size", default=50): All(Coerce(int), Range(min=1)),
+                    Optional("max_chunk_size", default=5000): All(Coerce(int), Range(min=1)),
+                    Optional("target_latency", default=5): All(Coerce(float), Range(min=0)),
+                    Optional("max_retries", default=5): All(Coerce(int), Range(min=0)),
+                    Optional("initial_backoff", default=1): All(Coerce(float), Range(min=0)),
+                    Optional("max_backoff", default=60): All(Coerce(float), Range(min=0)),
+                    Optional("op_field", default=None): Any(None, str),
+                    Optional("id_fields", default=None): Any(None, All([str], Length(min=1))),
                 },
             }
         )
@@ -50,18 +190,232 @@ class OpenSearch(Delta):
             verify_certs=conn_conf["verify_certs"],
             ca_certs=conn_conf["ca_cert_path"],
             url_prefix=conn_conf["url_prefix"],
+            pool_maxsize=AppController.process_share(conn_conf["pool_maxsize"]),
         )
 
         self._connection.ping()
 
+        # created once per process, as tasks and buffer threads send concurrently
+        if self._config["processing"]["mode"] == "adaptive":
+            self._executor = ThreadPoolExecutor(
+                self._config["processing"]["thread_count"],
+                thread_name_prefix=f"opensearch-{self.name}",
+            )
+
+    def _iter_actions(self, data: list[dict]) -> typing.Iterator[dict]:
+        """Yields the bulk actions lazily, referencing each document without metadata instead
+        of copying it, so fields like `_id` and `routing` still apply to the action.
+        The configured `index` replaces an `_index` of the document.
+        With an `op_field`, documents replace or delete the one of their `id_fields`."""
+        proc_conf = self._config["processing"]
+        index, op_field = proc_conf["index"], proc_conf["op_field"]
+
+        for document in data:
+            meta, source = split_meta(document)
+            if op_field is None:
+                yield {**meta, "_index": index, "_source": source}
+                continue
+
+            source = {key: value for key, value in source.items() if key != op_field}
+            meta = {"_id": document_id(source, proc_conf["id_fields"]), **meta}
+
+            if document.get(op_field) == "delete":
+                yield {**meta, "_index": index, "_op_type": "delete"}
+            else:
+                yield {**meta, "_index": index, "_op_type": "index", "_source": source}
+
     def function(self, data: list[dict], *args) -> None:
         proc_conf = self._config["processing"]
-        payload = [d | {"_index": proc_conf["index"]} for d in data]
 
-        with self._synchronizer:
-            bulk(self._connection, payload, request_timeout=proc_conf["timeout"])
+        if isinstance(data, dict):
+            data = [data]
+
+        actions = self._iter_actions(data)
+        options = {
+            "chunk_size": proc_conf["chunk_size"],
+            "max_chunk_bytes": proc_conf["max_chunk_bytes"],
+            "request_timeout": Deadline.timeout(proc_conf["timeout"]),
+            "raise_on_error": False,
+        }
+
+        # the client's connection pool is thread-safe, so requests need no synchronization
+        if proc_conf["mode"] == "adaptive":
+            self._adaptive_bulk(data)
+            return
+
+        if proc_conf["mode"] == "parallel":
+            results = parallel_bulk(
+                self._connection, actions, thread_count=proc_conf["thread_count"], **options
+            )
+        else:
+            results = streaming_bulk(self._connection, actions, **options)
+
+        # results arrive in the order of the documents, so the ones after an error are unsent
+        failures, sent = [], 0
+        try:
+            for document, (ok, item) in zip(data, results):
+                sent += 1
+                if not ok and is_failure(item):
+                    failures.append((document, item))
+
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            if not sent or not self.is_transient(e):
+                raise
+            self._raise_failures(len(data), failures, data[sent:], e)
+
+        self._raise_failures(len(data), failures)
+
+    @staticmethod
+    def _raise_failures(
+        total: int,
+        failures: list[tuple[dict, dict]],
+        unsent: list[dict] | None = None,
+        error: typing.Any = None,
+    ) -> None:
+        """Raises a `PartialSendError` with the documents of the failed bulk items and those
+        left unsent by a transient error, split by whether they may be sent again."""
+        transient, failed = list(unsent or []), []
+
+        for document, item in failures:
+            result = next(iter(item.values()))
+            status = result.get("status", 500)
+
+            (transient if is_transient_status(status) else failed).append(document)
+            error = error or result.get("error")
+
+        if transient or failed:
+            raise PartialSendError(
+                f"{len(transient) + len(failed)} of {total} document(s) failed to index: {error}",
+                transient,
+                failed,
+            )
+
+    def _adaptive_bulk(self, data: list[dict]) -> None:
+        """Sends the documents in rounds of concurrent chunks sized by the controller.
+        Only documents rejected by the cluster are retried, with exponential backoff."""
+        proc_conf = self._config["processing"]
+
+        pending = collections.deque(data)
+        failures, attempt, sent = [], 0, 0
+        deadline = Deadline.current()
+
+        while pending:
+            chunk_size, concurrency = self._controller.limits()
+            chunks = [
+                [pending.popleft() for _ in range(min(chunk_size, len(pending)))]
+                for _ in range(concurrency)
+                if pending
+            ]
+
+            try:
+                outcomes = list(
+                    self._executor.map(lambda chunk: self._send_chunk(chunk, deadline), chunks)
+                )
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                # chunks of earlier rounds were sent, while those of the failed round are unknown
+                if not sent or not self.is_transient(e):
+                    raise
+                unsent = [document for chunk in chunks for document in chunk] + list(pending)
+                self._raise_failures(len(data), failures, unsent, e)
+
+            rejected, latency = [], 0.0
+            for chunk_latency, chunk_rejected, chunk_failures in outcomes:
+                latency = max(latency, chunk_latency)
+                rejected += chunk_rejected
+                failures += chunk_failures
+
+            sent += sum(map(len, chunks)) - len(rejected)
+            self._controller.record(latency, len(rejected))
+
+            if not rejected:
+                attempt = 0
+                continue
+
+            attempt += 1
+            if attempt > proc_conf["max_retries"]:
+                unsent = rejected + list(pending)
+                self._raise_failures(len(data), failures, unsent, "rejected too often")
+
+            backoff = proc_conf["initial_backoff"] * 2 ** (attempt - 1)
+            backoff = min(proc_conf["max_backoff"], backoff)
+            logging.warning(
+                "OpenSearch rejected %s document(s), retrying in %ss", len(rejected), backoff
+            )
+
+            time.sleep(Deadline.timeout(backoff, deadline))
+            pending.extendleft(reversed(rejected))
+
+        self._raise_failures(len(data), failures)
+
+    def _encode_requests(self, chunk: list[dict]) -> list[tuple[list[dict], str]]:
+        """Returns the bulk bodies of the chunk with their documents, split into requests of
+        at most `max_chunk_bytes` like the bulk helpers. A larger document is sent alone."""
+        proc_conf = self._config["processing"]
+        serializer = self._connection.transport.serializer
+
+        requests, documents, lines, size = [], [], [], 0
+        for document, bulk_action in zip(chunk, self._iter_actions(chunk)):
+            action, source = expand_action(bulk_action)
+
+            encoded = [serializer.dumps(action)]
+            if source is not None:
+                encoded.append(serializer.dumps(source))
+            entry_size = sum(len(line.encode("utf-8")) + 1 for line in encoded)
+
+            if documents and size + entry_size > proc_conf["max_chunk_bytes"]:
+                requests.append((documents, "\n".join(lines) + "\n"))
+                documents, lines, size = [], [], 0
+
+            documents.append(document)
+            lines += encoded
+            size += entry_size
+
+        if documents:
+            requests.append((documents, "\n".join(lines) + "\n"))
+
+        return requests
+
+    def _send_chunk(
+        self, chunk: list[dict], deadline: Deadline | None = None
+    ) -> tuple[float, list[dict], list[tuple[dict, dict]]]:
+        """Sends the bulk requests of a chunk and returns their latency, rejected documents
+        and failed documents with their items."""
+        proc_conf = self._config["processing"]
+
+        start = time.monotonic()
+        rejected, failed = [], []
+
+        for documents, body in self._encode_requests(chunk):
+            try:
+                response = self._connection.bulk(
+                    body=body, request_timeout=Deadline.timeout(proc_conf["timeout"], deadline)
+                )
+
+            except ConnectionTimeout:
+                self._controller.record(time.monotonic() - start, len(chunk))
+                raise
+
+            except TransportError as e:
+                if e.status_code != 429:
+                    raise
+
+                rejected += documents
+                continue
+
+            if response["errors"]:
+                for document, item in zip(documents, response["items"]):
+                    result = next(iter(item.values()))
+
+                    if result.get("status") == 429:
+                        rejected.append(document)
+                    elif is_failure(item):
+                        failed.append((document, item))
+
+        return time.monotonic() - start, rejected, failed
 
     def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown()
         if self._connection is not None:
             self._connection.close()
         logging.info("Closed all OpenSearch connections for delta %s.", self.name)
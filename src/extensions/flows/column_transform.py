@@ -0,0 +1,375 @@
+import ast
+import functools
+import itertools
+import operator
+import typing
+
+import numpy
+from voluptuous import Schema, All, Length, Optional, Any, Invalid
+
+from core.app import LowerVal
+from core.columnar import ColumnarBatch, as_batch
+from core.node import Flow
+
+_ARITHMETIC = {
+    ast.Add: numpy.add,
+    ast.Sub: numpy.subtract,
+    ast.Mult: numpy.multiply,
+    ast.Div: numpy.true_divide,
+    ast.FloorDiv: numpy.floor_divide,
+    ast.Mod: numpy.mod,
+    ast.Pow: numpy.power,
+}
+_DIVISIONS = (ast.Div, ast.FloorDiv, ast.Mod)
+
+_COMPARISONS = {
+    ast.Eq: operator.eq,
+    ast.NotEq: operator.ne,
+    ast.Lt: operator.lt,
+    ast.LtE: operator.le,
+    ast.Gt: operator.gt,
+    ast.GtE: operator.ge,
+}
+
+_CASTS = {"int": numpy.int64, "float": numpy.float64, "bool": numpy.bool_, "str": object}
+
+
+class _Vector(typing.NamedTuple):
+    """The values of a column with a mask of its nulls, which is `None` if it has none.
+    Constants keep a scalar value, which numpy broadcasts to the length of the columns."""
+
+    values: typing.Any
+    nulls: numpy.ndarray | None = None
+
+
+type Evaluator = typing.Callable[["_Frame"], _Vector]
+
+
+def _to_vector(values: list) -> _Vector:
+    """Returns the values as a typed array, with nulls replaced by a value of the same type."""
+    kinds, nulls = set(map(type, values)), None
+    if type(None) in kinds:
+        kinds.discard(type(None))
+        nulls = numpy.fromiter(map(operator.is_, values, itertools.repeat(None)), bool, len(values))
+
+    if kinds and kinds <= {bool}:
+        dtype, fill = numpy.bool_, False
+    elif kinds and kinds <= {bool, int}:
+        dtype, fill = numpy.int64, 0
+    elif not kinds or kinds <= {bool, int, float}:
+        dtype, fill = numpy.float64, 0.0
+    else:
+        dtype, fill = object, "" if kinds == {str} else None
+
+    if nulls is not None:
+        values = [fill if value is None else value for value in values]
+
+    try:
+        # values like lists or dicts are kept as single objects instead of nested arrays
+        if dtype is object and kinds != {str}:
+            return _Vector(numpy.fromiter(values, object, len(values)), nulls)
+
+        return _Vector(numpy.array(values, dtype=dtype), nulls)
+
+    except OverflowError:
+        return _Vector(numpy.array(values, dtype=object), nulls)
+
+
+def _merge_nulls(*vectors: _Vector) -> numpy.ndarray | None:
+    masks = [vector.nulls for vector in vectors if vector.nulls is not None]
+    return functools.reduce(numpy.logical_or, masks) if masks else None
+
+
+def _truth(vector: _Vector) -> numpy.ndarray:
+    """Returns whether each value is true, where nulls are false."""
+    values = numpy.asarray(vector.values).astype(bool)
+    return values if vector.nulls is None else values & ~vector.nulls
+
+
+def _negate(vector: _Vector) -> _Vector:
+    return _Vector(numpy.negative(vector.values), vector.nulls)
+
+
+class Expression:
+    """An expression over the columns of a batch, which is compiled once from the
+    configuration and evaluated on whole columns at once. It supports arithmetic,
+    comparisons, `and`, `or`, `not`, `in` with a list of constants and null checks like
+    `value is None`. Nulls propagate through arithmetic, and comparisons with them are false."""
+
+    def __init__(self, text: str):
+        self.text = text
+
+        try:
+            tree = ast.parse(text, mode="eval")
+        except SyntaxError as e:
+            raise Invalid(f"Expression `{text}` is invalid: {e.msg}") from e
+
+        self._evaluator = self._compile(tree.body)
+
+    @classmethod
+    def compile(cls, text: str) -> "Expression":
+        """Validates and compiles an expression of the configuration."""
+        return cls(text)
+
+    def evaluate(self, frame: "_Frame") -> _Vector:
+        return self._evaluator(frame)
+
+    def _unsupported(self, node: ast.AST) -> Invalid:
+        return Invalid(f"Expression `{self.text}` uses unsupported syntax `{ast.unparse(node)}`.")
+
+    def _compile(self, node: ast.AST) -> Evaluator:
+        if isinstance(node, ast.Name):
+            return lambda frame: frame.vector(node.id)
+
+        if isinstance(node, ast.Constant):
+            if node.value is None or not isinstance(node.value, (bool, int, float, str)):
+                raise self._unsupported(node)
+
+            constant = _Vector(node.value)
+            return lambda _: constant
+
+        if isinstance(node, ast.BinOp) and type(node.op) in _ARITHMETIC:
+            return self._compile_arithmetic(node)
+
+        if isinstance(node, ast.UnaryOp):
+            operand = self._compile(node.operand)
+
+            if isinstance(node.op, ast.Not):
+                return lambda frame: _Vector(~_truth(operand(frame)))
+            if isinstance(node.op, ast.USub):
+                return lambda frame: _negate(operand(frame))
+            if isinstance(node.op, ast.UAdd):
+                return operand
+
+        if isinstance(node, ast.BoolOp):
+            operands = [self._compile(value) for value in node.values]
+            combine = numpy.logical_and if isinstance(node.op, ast.And) else numpy.logical_or
+
+            return lambda frame: _Vector(
+                functools.reduce(combine, (_truth(operand(frame)) for operand in operands))
+            )
+
+        if isinstance(node, ast.Compare):
+            # chained comparisons like `0 < a < 10` hold if each pair holds
+            pairs = [
+                self._compile_comparison(left, op, right)
+                for left, op, right in zip(
+                    [node.left, *node.comparators], node.ops, node.comparators
+                )
+            ]
+            if len(pairs) == 1:
+                return pairs[0]
+
+            return lambda frame: _Vector(
+                functools.reduce(numpy.logical_and, (pair(frame).values for pair in pairs))
+            )
+
+        raise self._unsupported(node)
+
+    def _compile_arithmetic(self, node: ast.BinOp) -> Evaluator:
+        left, right = self._compile(node.left), self._compile(node.right)
+        func, division = _ARITHMETIC[type(node.op)], isinstance(node.op, _DIVISIONS)
+
+        def evaluate(frame: "_Frame") -> _Vector:
+            left_vector, right_vector = left(frame), right(frame)
+            divisor, nulls = right_vector.values, _merge_nulls(left_vector, right_vector)
+
+            # a division by zero yields null instead of an infinite value or an error
+            if division:
+                zeros = numpy.equal(divisor, 0)
+                divisor = numpy.where(zeros, 1, divisor)
+                nulls = zeros if nulls is None else nulls | zeros
+
+            with numpy.errstate(all="ignore"):
+                return _Vector(func(left_vector.values, divisor), nulls)
+
+        return evaluate
+
+    def _compile_comparison(self, left: ast.AST, op: ast.cmpop, right: ast.AST) -> Evaluator:
+        null_check = isinstance(right, ast.Constant) and right.value is None
+        if null_check and isinstance(op, (ast.Is, ast.IsNot, ast.Eq, ast.NotEq)):
+            operand, negate = self._compile(left), isinstance(op, (ast.IsNot, ast.NotEq))
+
+            def evaluate_null(frame: "_Frame") -> _Vector:
+                vector = operand(frame)
+                nulls = vector.nulls if vector.nulls is not None else numpy.zeros_like(
+                    numpy.asarray(vector.values), dtype=bool
+                )
+                return _Vector(~nulls if negate else nulls)
+
+            return evaluate_null
+
+        if isinstance(op, (ast.In, ast.NotIn)):
+            if not isinstance(right, (ast.List, ast.Tuple, ast.Set)) or not all(
+                isinstance(element, ast.Constant) for element in right.elts
+            ):
+                raise self._unsupported(right)
+
+            operand, negate = self._compile(left), isinstance(op, ast.NotIn)
+            options = [element.value for element in right.elts]
+
+            def evaluate_in(frame: "_Frame") -> _Vector:
+                vector = operand(frame)
+                values = numpy.asarray(vector.values)
+
+                if values.dtype == object:
+                    option_set = set(options)
+                    found = numpy.fromiter((v in option_set for v in values), bool, len(values))
+                else:
+                    found = numpy.isin(values, options)
+
+                found = ~found if negate else found
+                return _Vector(found if vector.nulls is None else found & ~vector.nulls)
+
+            return evaluate_in
+
+        if type(op) not in _COMPARISONS:
+            raise self._unsupported(ast.Compare(left, [op], [right]))
+
+        left_operand, right_operand = self._compile(left), self._compile(right)
+        func = _COMPARISONS[type(op)]
+
+        def evaluate(frame: "_Frame") -> _Vector:
+            left_vector, right_vector = left_operand(frame), right_operand(frame)
+            values = numpy.asarray(func(left_vector.values, right_vector.values), dtype=bool)
+
+            nulls = _merge_nulls(left_vector, right_vector)
+            return _Vector(values if nulls is None else values & ~nulls)
+
+        return evaluate
+
+
+class _Frame:
+    """The columns of a batch while it is transformed. Columns are converted into arrays
+    only once an expression or cast uses them, all others are passed on as lists."""
+
+    def __init__(self, batch: ColumnarBatch):
+        self.length = batch.num_rows
+        self._columns: dict[str, list | _Vector] = dict(batch.columns)
+
+    def vector(self, name: str) -> _Vector:
+        """Returns the column as a vector, converting it on first use."""
+        try:
+            column = self._columns[name]
+        except KeyError as e:
+            raise ValueError(f"Column `{name}` is not part of the batch.") from e
+
+        if not isinstance(column, _Vector):
+            column = self._columns[name] = _to_vector(column)
+
+        return column
+
+    def assign(self, name: str, vector: _Vector) -> None:
+        """Sets a column, broadcasting constants to the length of the batch."""
+        values = vector.values
+        if not isinstance(values, numpy.ndarray) or values.shape != (self.length,):
+            dtype = object if isinstance(values, str) else None
+            values = numpy.full(self.length, values, dtype=dtype)
+
+        nulls = vector.nulls
+        if nulls is not None:
+            nulls = numpy.broadcast_to(nulls, (self.length,))
+
+        self._columns[name] = _Vector(values, nulls)
+
+    def filter(self, condition: _Vector) -> None:
+        """Keeps the rows for which the condition is true."""
+        keep = numpy.broadcast_to(_truth(condition), (self.length,))
+
+        for name, column in self._columns.items():
+            if isinstance(column, _Vector):
+                nulls = None if column.nulls is None else column.nulls[keep]
+                self._columns[name] = _Vector(column.values[keep], nulls)
+            else:
+                self._columns[name] = list(itertools.compress(column, keep))
+
+        self.length = int(keep.sum())
+
+    def cast(self, name: str, type_name: str) -> None:
+        """Converts the values of a column like the Python type of the same name."""
+        vector = self.vector(name)
+
+        if type_name == "str":
+            values = numpy.array(list(map(str, vector.values.tolist())), dtype=object)
+        elif vector.nulls is None:
+            values = vector.values.astype(_CASTS[type_name])
+        else:
+            # nulls hold placeholder values, which may not be convertible
+            values = numpy.zeros(self.length, dtype=_CASTS[type_name])
+            values[~vector.nulls] = vector.values[~vector.nulls].astype(_CASTS[type_name])
+
+        self._columns[name] = _Vector(values, vector.nulls)
+
+    def select(self, names: list[str]) -> None:
+        """Keeps only the named columns in the given order."""
+        for name in names:
+            if name not in self._columns:
+                raise ValueError(f"Column `{name}` is not part of the batch.")
+
+        self._columns = {name: self._columns[name] for name in names}
+
+    def to_batch(self) -> ColumnarBatch:
+        """Returns the columns as JSON-safe lists."""
+        columns = {}
+        for name, column in self._columns.items():
+            if isinstance(column, _Vector):
+                values = column.values.tolist()
+                if column.nulls is not None:
+                    for i in numpy.flatnonzero(column.nulls):
+                        values[i] = None
+                column = values
+
+            columns[name] = column
+
+        return ColumnarBatch(columns)
+
+
+class ColumnTransform(Flow):
+    """Transforms batches column by column with numpy instead of row by row.
+    It first adds the `compute` columns from expressions in their order, then keeps the rows
+    matching the `filter` expression, converts the types of the `cast` columns and finally
+    keeps only the `select` columns. Results are sent as a columnar batch unless `output`
+    is set to `rows`."""
+
+    columnar = True
+
+    @staticmethod
+    def config_schema() -> "Schema":
+        return Schema(
+            {
+                "processing": {
+                    "outputs": All(
+                        [str],
+                        Length(min=1, msg="At least one output must be defined!"),
+                    ),
+                    Optional("compute", default={}): {str: All(str, Expression.compile)},
+                    Optional("filter", default=None): Any(All(str, Expression.compile), None),
+                    Optional("cast", default={}): {str: LowerVal(Any(*_CASTS))},
+                    Optional("select", default=None): Any(None, All([str], Length(min=1))),
+                    Optional("output", default="columnar"): LowerVal(Any("columnar", "rows")),
+                },
+            }
+        )
+
+    def function(self, data, *args) -> "ColumnarBatch | list[dict] | None":
+        proc_conf = self._config["processing"]
+        frame = _Frame(as_batch(data))
+
+        for name, expression in proc_conf["compute"].items():
+            frame.assign(name, expression.evaluate(frame))
+
+        if (condition := proc_conf["filter"]) is not None:
+            frame.filter(condition.evaluate(frame))
+
+        for name, type_name in proc_conf["cast"].items():
+            frame.cast(name, type_name)
+
+        if (names := proc_conf["select"]) is not None:
+            frame.select(names)
+
+        # batches without any remaining rows are not sent
+        if frame.length == 0:
+            return None
+
+        batch = frame.to_batch()
+        return batch.to_rows() if proc_conf["output"] == "rows" else batch
@@ -1,18 +1,31 @@
+import logging
 import threading
-import time
 
-from voluptuous import Schema, All, Length, Coerce, Optional
+from voluptuous import Schema, All, Length, Coerce, Optional, Range, Any
 
 from core.graph import NodeGraph
 from core.node import Flow
+from core.payload import estimate_size
+from core.trace import Trace
 
 
 class ArrayBatcher(Flow):
+    """Collects incoming items and sends them as one batch once `max_items` or
+    `max_bytes` is reached or `timeframe` seconds passed since the first item.
+
+    A full batch is sent right away by the task which filled it, so the buffer never
+    grows past its limits and fast writers are slowed down to the rate of sending.
+    The timeframe is tracked by a timer thread instead of a waiting worker task, and
+    items still buffered on shutdown are sent as a last batch. Sizes are estimated as the
+    average item size of each received batch."""
+
     def __init__(self, config):
         super().__init__(config)
 
-        self._is_batching = False
         self._buffer = []
+        self._buffer_bytes = 0
+        self._buffer_trace = None
+        self._timer: threading.Timer | None = None
         self._synchronizer = threading.Lock()
 
     @classmethod
@@ -29,29 +42,88 @@ class ArrayBatcher(Flow):
                         Length(min=1, msg="At least one output must be defined!"),
                     ),
                     Optional("timeframe", default=5): Coerce(int),
+                    Optional("max_items", default=10000): All(Coerce(int), Range(min=1)),
+                    Optional("max_bytes", default=None): Any(
+                        None, All(Coerce(int), Range(min=1))
+                    ),
                 },
             }
         )
 
-    def function(self, data, *args) -> list | None:
+    def function(self, data, *args) -> None:
         proc_conf = self._config["processing"]
+        max_items, max_bytes = proc_conf["max_items"], proc_conf["max_bytes"]
 
         if isinstance(data, dict):
             data = [data]
 
+        item_bytes = 0
+        if max_bytes is not None and data:
+            item_bytes = estimate_size(data) // len(data)
+
+        full_batches = []
         with self._synchronizer:
-            self._buffer += data
+            for item in data:
+                # a batch carries the trace of its oldest item
+                if not self._buffer:
+                    self._buffer_trace = Trace.current()
 
-            if self._is_batching:
-                return None
+                self._buffer.append(item)
+                self._buffer_bytes += item_bytes
 
-            self._is_batching = True
+                if len(self._buffer) >= max_items or (
+                    max_bytes is not None and self._buffer_bytes >= max_bytes
+                ):
+                    full_batches.append(self._take_buffer())
 
-        time.sleep(proc_conf["timeframe"])
+            if self._buffer and self._timer is None:
+                self._timer = threading.Timer(proc_conf["timeframe"], self._flush_on_timer)
+                self._timer.daemon = True
+                self._timer.start()
 
+        for batch, trace in full_batches:
+            self._send(batch, trace)
+
+    def shutdown(self) -> None:
         with self._synchronizer:
-            finished_buffer = self._buffer.copy()
-            self._buffer.clear()
-            self._is_batching = False
+            batch, trace = self._take_buffer()
+
+        try:
+            self._send(batch, trace)
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            logging.error(
+                "[%s] Batcher `%s` failed to send its last batch of %s item(s): %s",
+                *(e.__class__.__name__, self.name, len(batch), str(e)),
+            )
+
+    def _take_buffer(self) -> tuple[list, dict | None]:
+        """Returns the buffered items with their trace and resets the buffer, must hold the lock."""
+        batch, trace = self._buffer, self._buffer_trace
+        self._buffer, self._buffer_bytes, self._buffer_trace = [], 0, None
+
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        return batch, trace
+
+    def _flush_on_timer(self) -> None:
+        with self._synchronizer:
+            # a batch filled up while the timer fired
+            if threading.current_thread() is not self._timer:
+                return
+
+            self._timer = None
+            batch, trace = self._take_buffer()
+
+        try:
+            self._send(batch, trace)
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            logging.error(
+                "[%s] Batcher `%s` failed to send batch: %s",
+                *(e.__class__.__name__, self.name, str(e)),
+            )
 
-        return finished_buffer
+    def _send(self, batch: list, trace: dict | None) -> None:
+        if batch:
+            NodeGraph.send_result(batch, self.output_ids, self.fused_ids, trace)
@@ -0,0 +1,148 @@
+import json
+import logging
+
+from voluptuous import Schema, All, Length, Coerce, Optional, Range, Any
+
+from core.app import AppController, LowerVal
+from core.graph import NodeGraph
+from core.node import Flow
+from core.state import state_path
+from core.trace import Trace
+from extensions.flows.snapshot_index import SnapshotIndex, content_hash, key_hash
+
+
+_ENCODER = json.JSONEncoder(separators=(",", ":"), default=str)
+
+
+def _encode(values) -> bytes:
+    return _ENCODER.encode(values).encode("utf-8")
+
+
+class SnapshotDiff(Flow):
+    """Forwards only the rows of repeated snapshots which were inserted, updated or deleted
+    since the previous snapshot, marked by the `op_field`. Rows are identified by their `keys`
+    and compared by a hash of their `fields`, by default all of them.
+
+    A snapshot is each received batch, or with `snapshot: run` all batches of one run of the
+    originating task, like the chunks of a streamed query. Keys missing from a snapshot are
+    only sent as deletes with `deletes` enabled, which for runs happens once the next run
+    starts. Changes are sent before the index is updated, so a failed send repeats them.
+
+    Each worker process keeps its own index unless it is persisted, so deletes are only sent
+    from several processes sharing a persisted index, as others never saw the keys."""
+
+    def __init__(self, config):
+        super().__init__(config)
+
+        self._index: SnapshotIndex | None = None
+
+    @staticmethod
+    def config_schema() -> "Schema":
+        return Schema(
+            {
+                "processing": {
+                    "outputs": All(
+                        [str],
+                        Length(min=1, msg="At least one output must be defined!"),
+                    ),
+                    "keys": All([str], Length(min=1)),
+                    Optional("fields", default=None): Any(None, All([str], Length(min=1))),
+                    Optional("snapshot", default="batch"): LowerVal(Any("batch", "run")),
+                    Optional("deletes", default=False): Coerce(bool),
+                    Optional("persist", default=False): Coerce(bool),
+                    Optional("capacity", default=1 << 16): All(Coerce(int), Range(min=1)),
+                    Optional("op_field", default="_op"): str,
+                },
+            }
+        )
+
+    def connect(self) -> None:
+        proc_conf = self._config["processing"]
+        if proc_conf["deletes"] and not proc_conf["persist"] and AppController.process_count() > 1:
+            raise ValueError(
+                f"Flow `{self.name}` needs `persist` to send deletes from several processes."
+            )
+
+        path = state_path("snapshots", f"{self.name}.index") if proc_conf["persist"] else None
+
+        self._index = SnapshotIndex(path, proc_conf["deletes"], proc_conf["capacity"])
+
+    def shutdown(self) -> None:
+        if self._index is not None:
+            self._index.close()
+        logging.info("Closed snapshot index of flow %s.", self.name)
+
+    def function(self, data, *args) -> None:
+        proc_conf = self._config["processing"]
+        rows = [data] if isinstance(data, dict) else data
+
+        with self._index.locked() as index:
+            # a batch of another run completes the snapshot of the previous one
+            run_id, previous_run = None, False
+            if proc_conf["snapshot"] == "run" and (trace := Trace.current()) is not None:
+                run_id = bytes.fromhex(trace["id"])
+                previous_run = index.run_id is not None and index.run_id != run_id
+
+            deleted = []
+            if previous_run and proc_conf["deletes"] and index.count > index.seen:
+                deleted = index.stale()
+
+            changes, pending, tracked = self._diff(index, rows, set(deleted))
+
+            # the slots are only scanned if some tracked keys are missing from the batch
+            if proc_conf["snapshot"] == "batch" and proc_conf["deletes"] and index.count > tracked:
+                deleted = index.stale(pending)
+
+            # deletes come first, as keys deleted from the previous run may be inserted again
+            keys = proc_conf["keys"]
+            results = [
+                dict(zip(keys, json.loads(index.key(khash)))) | {proc_conf["op_field"]: "delete"}
+                for khash in deleted
+            ] + changes
+            if results:
+                NodeGraph.send_result(results, self.output_ids, self.fused_ids)
+
+            for khash in deleted:
+                index.remove(khash)
+
+            if previous_run or (run_id is not None and index.run_id is None):
+                index.start_generation(run_id)
+
+            index.upsert((khash, chash, key) for khash, (chash, key) in pending.items())
+
+            if proc_conf["snapshot"] == "batch":
+                index.start_generation()
+
+    def _diff(
+        self, index: SnapshotIndex, rows: list[dict], deleted: set[int]
+    ) -> tuple[list[dict], dict[int, tuple[int, bytes]], int]:
+        """Returns the changed rows marked by their operation, the content hash and encoded
+        key of every row by its key hash, and how many of these keys are already tracked."""
+        proc_conf = self._config["processing"]
+        keys, fields, op_field = proc_conf["keys"], proc_conf["fields"], proc_conf["op_field"]
+
+        changes, pending, tracked = [], {}, 0
+        for row in rows:
+            key = _encode([row.get(name) for name in keys])
+            khash = key_hash(key)
+
+            if fields is None:
+                chash = content_hash(_encode(sorted(row.items())))
+            else:
+                chash = content_hash(_encode([row.get(name) for name in fields]))
+
+            # keys deleted by this call are inserted again
+            if khash in pending:
+                previous = pending[khash][0]
+            else:
+                previous = None if khash in deleted else index.lookup(khash)
+                tracked += previous is not None
+
+            if previous is None:
+                changes.append(row | {op_field: "insert"})
+            elif previous != chash:
+                changes.append(row | {op_field: "update"})
+
+            pending[khash] = (chash, key)
+
+        return changes, pending, tracked
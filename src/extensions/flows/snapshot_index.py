@@ -0,0 +1,376 @@
+import contextlib
+import fcntl
+import hashlib
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import typing
+
+_HEADER = struct.Struct("<8sQQQQQ16s")
+_MAGIC = b"RIVSNAP2"
+_NO_RUN = bytes(16)
+
+_MAX_LOAD = 0.7
+_GENERATION_MASK = 0xFFFFFFFF
+_LENGTH_BITS = 24
+_LENGTH_MASK = (1 << _LENGTH_BITS) - 1
+_COMPACT_BYTES = 1 << 20
+
+
+class _Header(typing.NamedTuple):
+    magic: bytes
+    capacity: int
+    count: int
+    generation: int
+    seen: int
+    """Number of tracked keys seen in the current generation."""
+    key_bytes: int
+    """Size of the encoded keys which are still tracked."""
+    run_id: bytes
+
+
+def key_hash(data: bytes) -> int:
+    """Returns the 64-bit hash of an encoded key, which is never 0 as that marks empty slots."""
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), "little") or 1
+
+
+def content_hash(data: bytes) -> int:
+    """Returns the 64-bit hash of an encoded row."""
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), "little")
+
+
+def _probe(hashes: memoryview, khash: int) -> int:
+    """Returns the slot of the key, or the empty slot ending its probe sequence."""
+    mask = len(hashes) - 1
+    slot = khash & mask
+
+    while (current := hashes[slot]) != 0 and current != khash:
+        slot = (slot + 1) & mask
+
+    return slot
+
+
+class _KeyWriter:
+    """Appends encoded keys to the end of a keys file, buffered until flushed."""
+
+    def __init__(self, keys: typing.BinaryIO):
+        self._fd = keys.fileno()
+        self._start = self._end = os.fstat(self._fd).st_size
+        self._buffer: list[bytes] = []
+
+    def append(self, key: bytes) -> int:
+        """Returns the offset and length of the appended key packed into one integer."""
+        offset = self._end
+        self._buffer.append(key)
+        self._end += len(key)
+        return offset << _LENGTH_BITS | len(key)
+
+    def flush(self) -> None:
+        os.pwrite(self._fd, b"".join(self._buffer), self._start)
+        self._start, self._buffer = self._end, []
+
+
+def _read_key(keys: typing.BinaryIO, packed: int) -> bytes:
+    return os.pread(keys.fileno(), packed & _LENGTH_MASK, packed >> _LENGTH_BITS)
+
+
+class SnapshotIndex:
+    """This is an open-addressing hash table with linear probing, which maps the 64-bit hash
+    of each tracked key to the 64-bit hash of its row and the generation it was last seen in.
+    Slots are parallel arrays in a memory-mapped file, so the index costs 24 bytes per slot,
+    or 32 if the encoded keys are kept for deletes, and survives restarts if persisted.
+
+    Encoded keys are appended to a separate file, which is only read for deleted keys.
+    Without a path, both files are anonymous and only live as long as the process."""
+
+    def __init__(self, path: str | None, keep_keys: bool, capacity: int = 1 << 16):
+        self._path = path
+        self._keep_keys = keep_keys
+        self._initial_capacity = 1 << max(4, (capacity - 1).bit_length())
+
+        self._synchronizer = threading.Lock()
+        self._lock_file: typing.BinaryIO | None = None
+        self._inode: int | None = None
+
+        self._map: mmap.mmap | None = None
+        self._hashes: memoryview | None = None
+        self._contents: memoryview | None = None
+        self._generations: memoryview | None = None
+        self._offsets: memoryview | None = None
+        self._keys: typing.BinaryIO | None = None
+
+        if path is not None:
+            # growing replaces the index, so processes lock a file which is never replaced
+            self._lock_file = open(f"{path}.lock", "ab")  # pylint: disable=consider-using-with
+
+    @property
+    def count(self) -> int:
+        """Returns the number of tracked keys."""
+        return self._header().count
+
+    @property
+    def seen(self) -> int:
+        """Returns the number of tracked keys seen in the current generation."""
+        return self._header().seen
+
+    @property
+    def run_id(self) -> bytes | None:
+        """Returns the id of the run the current generation is collected from if any."""
+        run_id = self._header().run_id
+        return None if run_id == _NO_RUN else run_id
+
+    def start_generation(self, run_id: bytes | None = None) -> None:
+        """Completes the current generation and starts collecting the next one.
+        Keys of removed entries are compacted once they take most of the keys file."""
+        header = self._header()
+        self._write_header(
+            header._replace(
+                generation=(header.generation + 1) & _GENERATION_MASK,
+                seen=0,
+                run_id=run_id or _NO_RUN,
+            )
+        )
+
+        if self._keep_keys:
+            size = os.fstat(self._keys.fileno()).st_size
+            if size > 2 * header.key_bytes + _COMPACT_BYTES:
+                self._rebuild(header.capacity)
+
+    @contextlib.contextmanager
+    def locked(self) -> typing.Iterator["SnapshotIndex"]:
+        """Holds the index exclusively within this process and across processes sharing its
+        file, mapping it first if it is new or another process replaced it."""
+        with self._synchronizer:
+            if self._lock_file is None:
+                if self._map is None:
+                    self._install(*self._create(self._initial_capacity, None))
+                yield self
+                return
+
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+            try:
+                self._open()
+                yield self
+            finally:
+                self.flush()
+                fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+
+    def lookup(self, khash: int) -> int | None:
+        """Returns the content hash of a key if it is tracked."""
+        slot = _probe(self._hashes, khash)
+        return None if self._hashes[slot] == 0 else self._contents[slot]
+
+    def upsert(self, entries: typing.Iterable[tuple[int, int, bytes]]) -> None:
+        """Tracks the content hash of each key hash and encoded key as seen in the current
+        generation, growing the index once it is filled beyond its maximum load."""
+        header = self._header()
+        count, seen, key_bytes = header.count, header.seen, header.key_bytes
+        writer = _KeyWriter(self._keys) if self._keep_keys else None
+
+        for khash, chash, key in entries:
+            slot = _probe(self._hashes, khash)
+
+            if self._hashes[slot] == 0:
+                self._hashes[slot] = khash
+                if writer is not None:
+                    self._offsets[slot] = writer.append(key)
+                count, seen, key_bytes = count + 1, seen + 1, key_bytes + len(key)
+
+            elif self._generations[slot] != header.generation:
+                seen += 1
+
+            self._contents[slot] = chash
+            self._generations[slot] = header.generation
+
+            if count > header.capacity * _MAX_LOAD:
+                header = header._replace(count=count, seen=seen, key_bytes=key_bytes)
+                self._write_header(header)
+                if writer is not None:
+                    writer.flush()
+
+                self._rebuild(header.capacity * 2)
+                header = self._header()
+                writer = _KeyWriter(self._keys) if self._keep_keys else None
+
+        self._write_header(header._replace(count=count, seen=seen, key_bytes=key_bytes))
+        if writer is not None:
+            writer.flush()
+
+    def remove(self, khash: int) -> None:
+        """Stops tracking a key. The following entries of its probe sequence are shifted
+        back into the gap, so lookups need no tombstones."""
+        header = self._header()
+        hashes, mask = self._hashes, header.capacity - 1
+
+        gap = _probe(hashes, khash)
+        if hashes[gap] == 0:
+            return
+
+        key_length = self._offsets[gap] & _LENGTH_MASK if self._keep_keys else 0
+
+        current = gap
+        while hashes[current := (current + 1) & mask] != 0:
+            # an entry stays if its home slot lies cyclically after the gap
+            home = hashes[current] & mask
+            if (gap < home <= current) or (current < gap and not current < home <= gap):
+                continue
+
+            self._move(current, gap)
+            gap = current
+
+        self._move(None, gap)
+        self._write_header(
+            header._replace(count=header.count - 1, key_bytes=header.key_bytes - key_length)
+        )
+
+    def stale(self, exclude: typing.Container[int] = ()) -> list[int]:
+        """Returns the hashes of the tracked keys not seen in the current generation."""
+        generation = self._header().generation
+
+        return [
+            khash
+            for khash, seen in zip(self._hashes.tolist(), self._generations.tolist())
+            if khash and seen != generation and khash not in exclude
+        ]
+
+    def key(self, khash: int) -> bytes:
+        """Returns the encoded key of a tracked key hash."""
+        return _read_key(self._keys, self._offsets[_probe(self._hashes, khash)])
+
+    def flush(self) -> None:
+        """Writes the changes of a persisted index to disk."""
+        if self._path is not None and self._map is not None:
+            self._map.flush()
+
+    def close(self) -> None:
+        with self._synchronizer:
+            self.flush()
+            self._release()
+
+            if self._lock_file is not None:
+                self._lock_file.close()
+                self._lock_file = None
+
+    def _move(self, source: int | None, target: int) -> None:
+        """Moves an entry into another slot, or empties the target without a source."""
+        arrays = [self._hashes, self._contents, self._generations]
+        if self._keep_keys:
+            arrays.append(self._offsets)
+
+        for array in arrays:
+            array[target] = 0 if source is None else array[source]
+
+    def _header(self) -> _Header:
+        return _Header._make(_HEADER.unpack_from(self._map))
+
+    def _write_header(self, header: _Header) -> None:
+        _HEADER.pack_into(self._map, 0, *header)
+
+    def _views(self, index_map: mmap.mmap) -> tuple[memoryview, ...]:
+        """Returns the arrays of key hashes, content hashes, generations and key offsets."""
+        capacity = _Header._make(_HEADER.unpack_from(index_map)).capacity
+        view = memoryview(index_map)
+        arrays = 4 if self._keep_keys else 3
+
+        return tuple(
+            view[_HEADER.size + capacity * 8 * i : _HEADER.size + capacity * 8 * (i + 1)].cast("Q")
+            for i in range(arrays)
+        )
+
+    def _create(
+        self, capacity: int, header: _Header | None
+    ) -> tuple[mmap.mmap, typing.BinaryIO]:
+        """Returns a new empty index and keys file, keeping the counters of the header."""
+        header = header or _Header(_MAGIC, capacity, 0, 0, 0, 0, _NO_RUN)
+        size = _HEADER.size + capacity * 8 * (4 if self._keep_keys else 3)
+
+        if self._path is None:
+            index_map = mmap.mmap(-1, size)
+            keys = tempfile.TemporaryFile()  # pylint: disable=consider-using-with
+        else:
+            # new files are written next to the index and replace it once complete
+            with open(f"{self._path}.{os.getpid()}", "w+b") as f:
+                f.truncate(size)
+                index_map = mmap.mmap(f.fileno(), 0)
+            keys = open(f"{self._path}.keys.{os.getpid()}", "w+b")  # pylint: disable=R1732
+
+        _HEADER.pack_into(index_map, 0, *header._replace(capacity=capacity))
+        return index_map, keys
+
+    def _install(self, index_map: mmap.mmap, keys: typing.BinaryIO) -> None:
+        """Replaces the current index with a created one."""
+        self._release()
+        self._map, self._keys = index_map, keys
+        self._hashes, self._contents, self._generations, *offsets = self._views(index_map)
+        self._offsets = offsets[0] if offsets else None
+
+        if self._path is not None:
+            index_map.flush()
+            os.replace(f"{self._path}.keys.{os.getpid()}", f"{self._path}.keys")
+            os.replace(f"{self._path}.{os.getpid()}", self._path)
+            self._inode = os.stat(self._path).st_ino
+
+    def _open(self) -> None:
+        """Maps the persisted index unless it is mapped already, creating it if missing."""
+        try:
+            inode = os.stat(self._path).st_ino
+        except FileNotFoundError:
+            self._install(*self._create(self._initial_capacity, None))
+            return
+
+        if inode == self._inode:
+            return
+
+        self._release()
+        with open(self._path, "r+b") as f:
+            self._map = mmap.mmap(f.fileno(), 0)
+        self._inode = inode
+
+        if self._header().magic != _MAGIC:
+            raise ValueError(f"File `{self._path}` is no snapshot index.")
+
+        self._hashes, self._contents, self._generations, *offsets = self._views(self._map)
+        self._offsets = offsets[0] if offsets else None
+        self._keys = open(f"{self._path}.keys", "a+b")  # pylint: disable=consider-using-with
+
+    def _release(self) -> None:
+        """Closes the mapping after releasing its views, and the keys file."""
+        for view in (self._hashes, self._contents, self._generations, self._offsets):
+            if view is not None:
+                view.release()
+        self._hashes = self._contents = self._generations = self._offsets = None
+
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        if self._keys is not None:
+            self._keys.close()
+            self._keys = None
+
+        self._inode = None
+
+    def _rebuild(self, capacity: int) -> None:
+        """Rehashes all entries into a new index of the capacity, compacting their keys."""
+        index_map, keys = self._create(capacity, self._header())
+        hashes, contents, generations, *offsets = self._views(index_map)
+        writer = _KeyWriter(keys)
+
+        for slot, khash in enumerate(self._hashes):
+            if khash == 0:
+                continue
+
+            target = _probe(hashes, khash)
+            hashes[target] = khash
+            contents[target] = self._contents[slot]
+            generations[target] = self._generations[slot]
+            if offsets:
+                key = _read_key(self._keys, self._offsets[slot])
+                offsets[0][target] = writer.append(key)
+
+        writer.flush()
+        for view in (hashes, contents, generations, *offsets):
+            view.release()
+
+        self._install(index_map, keys)
@@ -0,0 +1,389 @@
+import datetime
+import hashlib
+import json
+import logging
+import math
+import re
+import threading
+import typing
+
+from voluptuous import Schema, All, Length, Coerce, Optional, Range, Any, Invalid
+
+from core.graph import NodeGraph
+from core.node import Flow
+from core.trace import Trace
+
+_AGGREGATE = re.compile(r"^\s*(count|sum|min|max|avg|distinct)\s*\(\s*(\w*)\s*\)\s*$", re.I)
+
+
+def parse_aggregate(text: str) -> tuple[str, str | None]:
+    """Returns the function and field of an aggregate like `sum(amount)` or `count()`."""
+    if (match := _AGGREGATE.match(text)) is None:
+        raise Invalid(f"Aggregate `{text}` is not one of count, sum, min, max, avg or distinct.")
+
+    function, field = match.group(1).lower(), match.group(2) or None
+    if field is None and function != "count":
+        raise Invalid(f"Aggregate `{text}` requires a field.")
+
+    return function, field
+
+
+class _Count:
+    __slots__ = ("value",)
+
+    def __init__(self, _precision: int):
+        self.value = 0
+
+    def add(self, _value) -> None:
+        self.value += 1
+
+    def merge(self, other: "_Count") -> None:
+        self.value += other.value
+
+    def result(self) -> int:
+        return self.value
+
+
+class _Sum:
+    __slots__ = ("value",)
+
+    def __init__(self, _precision: int):
+        self.value = None
+
+    def add(self, value) -> None:
+        self.value = value if self.value is None else self.value + value
+
+    def merge(self, other: "_Sum") -> None:
+        if other.value is not None:
+            self.add(other.value)
+
+    def result(self):
+        return self.value
+
+
+class _Min(_Sum):
+    __slots__ = ()
+
+    def add(self, value) -> None:
+        if self.value is None or value < self.value:
+            self.value = value
+
+
+class _Max(_Sum):
+    __slots__ = ()
+
+    def add(self, value) -> None:
+        if self.value is None or value > self.value:
+            self.value = value
+
+
+class _Avg:
+    __slots__ = ("total", "count")
+
+    def __init__(self, _precision: int):
+        self.total, self.count = 0, 0
+
+    def add(self, value) -> None:
+        self.total += value
+        self.count += 1
+
+    def merge(self, other: "_Avg") -> None:
+        self.total += other.total
+        self.count += other.count
+
+    def result(self) -> float | None:
+        return self.total / self.count if self.count else None
+
+
+class HyperLogLog:
+    """Approximates the number of distinct values with `2^precision` registers of one byte,
+    at a standard error of about `1.04 / sqrt(2^precision)`, e.g. 1.6% for precision 12.
+    Values are hashed by their JSON form, so `1` and `"1"` are distinct."""
+
+    __slots__ = ("_precision", "_registers")
+
+    def __init__(self, precision: int):
+        self._precision = precision
+        self._registers = bytearray(1 << precision)
+
+    def add(self, value) -> None:
+        encoded = json.dumps(value, default=str).encode("utf-8")
+        digest = int.from_bytes(hashlib.blake2b(encoded, digest_size=8).digest(), "big")
+
+        # the first bits select the register, which keeps the longest run of leading zeros
+        bits = 64 - self._precision
+        index, remainder = digest >> bits, digest & ((1 << bits) - 1)
+        rank = bits - remainder.bit_length() + 1
+
+        if rank > self._registers[index]:
+            self._registers[index] = rank
+
+    def merge(self, other: "HyperLogLog") -> None:
+        self._registers = bytearray(map(max, self._registers, other._registers))
+
+    def result(self) -> int:
+        registers = self._registers
+        size = len(registers)
+
+        estimate = 0.7213 / (1 + 1.079 / size) * size * size
+        estimate /= sum(2.0**-rank for rank in registers)
+
+        # small cardinalities are counted more precisely by the empty registers
+        if estimate <= 2.5 * size and (empty := registers.count(0)):
+            estimate = size * math.log(size / empty)
+
+        return round(estimate)
+
+
+_AGGREGATORS = {
+    "count": _Count,
+    "sum": _Sum,
+    "min": _Min,
+    "max": _Max,
+    "avg": _Avg,
+    "distinct": HyperLogLog,
+}
+
+
+def _timestamp(value: typing.Any) -> float:
+    """Returns the event time of epoch seconds or an ISO string, without a zone in UTC."""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        if not math.isfinite(value):
+            raise ValueError(f"Event time `{value}` is not finite.")
+        return float(value)
+
+    if isinstance(value, str):
+        moment = datetime.datetime.fromisoformat(value)
+        if moment.tzinfo is None:
+            moment = moment.replace(tzinfo=datetime.timezone.utc)
+        return moment.timestamp()
+
+    raise ValueError(f"Event time `{value}` is neither epoch seconds nor an ISO string.")
+
+
+class WindowAggregate(Flow):
+    """Aggregates rows into tumbling windows of `size` seconds by their event time, or into
+    sliding windows starting every `slide` seconds. Rows are grouped by the `group_by` fields
+    and reduced by `aggregates` like `total: sum(amount)`, where `distinct` is approximated.
+
+    Each row is added once to a pane, whose length divides both the size and slide, and closed
+    windows merge their panes. A window closes once the watermark, the latest event time minus
+    the allowed `lateness`, passes its end, and then is sent with one row per group. Rows of
+    closed windows are dropped. With `idle_timeout`, all open windows are closed if no rows
+    arrived for as many seconds. The state is bound by the open panes and their groups."""
+
+    def __init__(self, config):
+        super().__init__(config)
+
+        proc_conf = self._config["processing"]
+        self._size = proc_conf["size"]
+        self._slide = proc_conf["slide"] or self._size
+        self._pane = math.gcd(self._size, self._slide)
+
+        if self._slide > self._size:
+            raise ValueError(f"Slide of flow `{self.name}` must not exceed its window size.")
+
+        self._aggregates = [
+            (name, _AGGREGATORS[function], field)
+            for name, (function, field) in proc_conf["aggregates"].items()
+        ]
+
+        # pane start -> group key -> aggregator states
+        self._panes: dict[int, dict[tuple, list]] = {}
+        self._next_window: int | None = None
+        self._watermark = -math.inf
+        # the format of window bounds, set by the first row with an event time
+        self._text_time: bool | None = None
+
+        self._trace: dict | None = None
+        self._timer: threading.Timer | None = None
+        self._synchronizer = threading.Lock()
+
+    @staticmethod
+    def config_schema() -> "Schema":
+        return Schema(
+            {
+                "processing": {
+                    "outputs": All(
+                        [str],
+                        Length(min=1, msg="At least one output must be defined!"),
+                    ),
+                    "time_field": str,
+                    "size": All(Coerce(int), Range(min=1)),
+                    Optional("slide", default=None): Any(None, All(Coerce(int), Range(min=1))),
+                    Optional("group_by", default=[]): [str],
+                    "aggregates": All({str: All(str, parse_aggregate)}, Length(min=1)),
+                    Optional("lateness", default=0): All(Coerce(int), Range(min=0)),
+                    Optional("idle_timeout", default=None): Any(
+                        None, All(Coerce(float), Range(min=0, min_included=False))
+                    ),
+                    Optional("precision", default=12): All(Coerce(int), Range(min=7, max=16)),
+                },
+            }
+        )
+
+    def shutdown(self) -> None:
+        with self._synchronizer:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+
+            if self._panes:
+                logging.warning(
+                    "Discarding %s open window pane(s) of flow %s", len(self._panes), self.name
+                )
+
+    def function(self, data, *args) -> list[dict] | None:
+        proc_conf = self._config["processing"]
+        time_field, group_by = proc_conf["time_field"], proc_conf["group_by"]
+        precision = proc_conf["precision"]
+
+        rows = [data] if isinstance(data, dict) else data
+
+        with self._synchronizer:
+            latest, dropped = -math.inf, 0
+
+            for row in rows:
+                try:
+                    event_time = _timestamp(row.get(time_field))
+                except (ValueError, TypeError, OverflowError):
+                    dropped += 1
+                    continue
+
+                if self._text_time is None:
+                    self._text_time = isinstance(row[time_field], str)
+
+                # the latest window containing the row was already sent
+                closed = self._next_window is not None
+                if closed and self._window_of(event_time) < self._next_window:
+                    dropped += 1
+                    continue
+
+                latest = max(latest, event_time)
+
+                pane = int(event_time // self._pane) * self._pane
+                groups = self._panes.setdefault(pane, {})
+
+                key = tuple(row.get(field) for field in group_by)
+                try:
+                    states = groups.get(key)
+                except TypeError:
+                    key = tuple(json.dumps(v) if isinstance(v, (list, dict)) else v for v in key)
+                    states = groups.get(key)
+
+                if states is None:
+                    states = groups[key] = [
+                        aggregator(precision) for _, aggregator, _ in self._aggregates
+                    ]
+
+                for state, (_, _, field) in zip(states, self._aggregates):
+                    # `count()` counts rows, all others skip nulls
+                    value = True if field is None else row.get(field)
+                    if value is not None:
+                        state.add(value)
+
+            if dropped:
+                logging.warning(
+                    "Flow %s dropped %s row(s) without a valid time or of closed windows",
+                    *(self.name, dropped),
+                )
+
+            self._watermark = max(self._watermark, latest - proc_conf["lateness"])
+            results = self._close_windows(self._watermark)
+
+            self._trace = Trace.current()
+            self._restart_timer()
+
+        return results or None
+
+    def _window_of(self, event_time: float) -> int:
+        """Returns the start of the latest window containing the event time."""
+        return int(event_time // self._slide) * self._slide
+
+    def _close_windows(self, watermark: float) -> list[dict]:
+        """Returns the rows of all windows ending before the watermark and drops the panes
+        which no open window contains anymore. Must hold the lock."""
+        results = []
+
+        while self._panes:
+            # the earliest window containing the first pane, skipping windows without rows
+            start = ((min(self._panes) - self._size) // self._slide + 1) * self._slide
+            if self._next_window is not None:
+                start = max(start, self._next_window)
+
+            if start + self._size > watermark:
+                break
+
+            results += self._window_rows(start)
+            self._next_window = start + self._slide
+
+            for pane in [p for p in self._panes if self._window_of(p) < self._next_window]:
+                del self._panes[pane]
+
+        return results
+
+    def _window_rows(self, start: int) -> list[dict]:
+        """Returns a row per group with the merged aggregates of the window's panes."""
+        proc_conf = self._config["processing"]
+        merged: dict[tuple, list] = {}
+
+        for pane, groups in self._panes.items():
+            if not start <= pane < start + self._size:
+                continue
+
+            for key, states in groups.items():
+                if (targets := merged.get(key)) is None:
+                    targets = merged[key] = [
+                        aggregator(proc_conf["precision"]) for _, aggregator, _ in self._aggregates
+                    ]
+
+                for target, state in zip(targets, states):
+                    target.merge(state)
+
+        window = {
+            "window_start": self._format_time(start),
+            "window_end": self._format_time(start + self._size),
+        }
+        return [
+            dict(zip(proc_conf["group_by"], key))
+            | window
+            | {name: state.result() for (name, _, _), state in zip(self._aggregates, states)}
+            for key, states in merged.items()
+        ]
+
+    def _format_time(self, seconds: int) -> str | int:
+        """Returns window bounds in the format of the event times."""
+        if self._text_time:
+            return datetime.datetime.fromtimestamp(seconds, datetime.timezone.utc).isoformat()
+        return seconds
+
+    def _restart_timer(self) -> None:
+        """Restarts the timer closing all windows once no rows arrived, must hold the lock."""
+        if (idle_timeout := self._config["processing"]["idle_timeout"]) is None:
+            return
+
+        if self._timer is not None:
+            self._timer.cancel()
+
+        self._timer = threading.Timer(idle_timeout, self._close_on_timer)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _close_on_timer(self) -> None:
+        with self._synchronizer:
+            # rows arrived while the timer fired
+            if threading.current_thread() is not self._timer:
+                return
+
+            self._timer = None
+            results = self._close_windows(math.inf)
+            trace = self._trace
+
+        try:
+            if results:
+                NodeGraph.send_result(results, self.output_ids, self.fused_ids, trace)
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            logging.error(
+                "[%s] Flow `%s` failed to send closed windows: %s",
+                *(e.__class__.__name__, self.name, str(e)),
+            )
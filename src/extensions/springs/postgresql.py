@@ -1,14 +1,66 @@
-import json
+import contextlib
+import contextvars
+import datetime
+import decimal
 import logging
+import threading
 import typing
+import uuid
+from concurrent.futures import FIRST_EXCEPTION, ThreadPoolExecutor, wait
 
-from psycopg2.extras import RealDictCursor
-from psycopg2.pool import ThreadedConnectionPool
-from voluptuous import Schema, All, Length, Coerce, Optional
+from psycopg2 import sql
+from psycopg2.extensions import TRANSACTION_STATUS_INERROR
+from psycopg2.pool import PoolError, ThreadedConnectionPool
+from voluptuous import Schema, All, Length, Coerce, Optional, Range, Any
 
-from core.app import EnvStr
+from core.app import AppController, EnvStr, LowerVal
+from core.columnar import ColumnarBatch, row_count
+from core.deadline import Deadline
+from core.graph import NodeGraph
 from core.node import Spring
 from core.cron import CronTask
+from core.state import StateStore
+from extensions.springs.postgresql_copy import CopyExport
+from extensions.springs.postgresql_types import NUMERIC, RowConverter, to_json_safe
+
+
+if typing.TYPE_CHECKING:
+    type Data = list | dict
+    type Query = str | sql.Composable
+
+
+def _as_time(value: typing.Any, other: typing.Any) -> typing.Any:
+    """Returns the bound comparable to the other bound of the range. Configured bounds
+    of time columns are given as ISO strings, which lack a timezone if naive."""
+    if isinstance(value, str):
+        value = datetime.datetime.fromisoformat(value)
+
+    if isinstance(other, datetime.datetime):
+        if not isinstance(value, datetime.datetime) and isinstance(value, datetime.date):
+            value = datetime.datetime.combine(value, datetime.time())
+
+        # naive values are taken as UTC against timestamps with a timezone and vice versa
+        if value.tzinfo is None and other.tzinfo is not None:
+            value = value.replace(tzinfo=datetime.timezone.utc)
+        elif value.tzinfo is not None and other.tzinfo is None:
+            value = value.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+
+    return value
+
+
+def _split_range(lower: typing.Any, upper: typing.Any, count: int) -> list[typing.Any]:
+    """Returns `count + 1` evenly spaced boundaries from lower to upper."""
+    if isinstance(lower, str):
+        lower = datetime.datetime.fromisoformat(lower)
+    if isinstance(upper, (str, datetime.date)):
+        upper = _as_time(upper, lower)
+    if isinstance(lower, datetime.date):
+        lower = _as_time(lower, upper)
+
+    if isinstance(lower, int) and isinstance(upper, int):
+        return [lower + (upper - lower + 1) * i // count for i in range(count + 1)]
+
+    return [lower + (upper - lower) * i / count for i in range(count + 1)]
 
 
 class PostgreSQL(Spring):
@@ -16,6 +68,9 @@ class PostgreSQL(Spring):
         super().__init__(config)
 
         self._connection: ThreadedConnectionPool | None = None
+        self._free_connections: threading.BoundedSemaphore | None = None
+        self._maxconn = 1
+        self._tasks = {t["name"]: t for t in self._config["tasks"]}
 
     @staticmethod
     def config_schema() -> "Schema":
@@ -42,6 +97,25 @@ class PostgreSQL(Spring):
                             ),
                             Optional("timeout", default=60): Coerce(int),
                             Optional("fields"): [str],
+                            Optional("jitter"): All(Coerce(int), Range(min=0)),
+                            Optional("overlap"): LowerVal(Any("allow", "skip", "coalesce")),
+                            Optional("stream", default=False): Coerce(bool),
+                            Optional("copy"): LowerVal(Any("csv", "binary")),
+                            Optional("format", default="rows"): LowerVal(Any("rows", "columnar")),
+                            Optional("chunk_size", default=10000): All(
+                                Coerce(int), Range(min=1)
+                            ),
+                            Optional("watermark"): {
+                                "column": str,
+                                "initial": Any(int, float, str),
+                            },
+                            Optional("partition"): {
+                                "column": str,
+                                "count": All(Coerce(int), Range(min=2)),
+                                Optional("lower"): Any(int, float, str, datetime.date),
+                                Optional("upper"): Any(int, float, str, datetime.date),
+                                Optional("parallelism"): All(Coerce(int), Range(min=1)),
+                            },
                         }
                     )
                 ],
@@ -50,34 +124,276 @@ class PostgreSQL(Spring):
 
     def connect(self) -> None:
         logging.info("Connecting to PostgreSQL database")
-        self._connection = ThreadedConnectionPool(**self._config["connection"])
+
+        config = dict(self._config["connection"])
+        config["maxconn"] = AppController.process_share(config["maxconn"])
+        config["minconn"] = min(config["minconn"], config["maxconn"])
+        self._connection = ThreadedConnectionPool(**config)
+        self._free_connections = threading.BoundedSemaphore(config["maxconn"])
+        self._maxconn = config["maxconn"]
 
     def get_periodic_tasks(self) -> typing.Generator["CronTask"]:
         for config in self._config["tasks"]:
             yield CronTask(
                 source=self,
                 task_name=config["name"],
-                task_args=[config["query"], config["timeout"]],
+                task_args=[config["query"], config["timeout"], config["name"]],
                 task_schedule=config["cron"],
                 task_outputs=config["outputs"],
+                jitter=config.get("jitter"),
+                overlap=config.get("overlap"),
             )
 
     def function(self, data, *args):
-        query, timeout_seconds = data, args[0]
-        conn = self._connection.getconn()
+        query, timeout_seconds, task_name = data, args[0], args[1]
+        task_conf = self._tasks[task_name]
+        watermark = self._load_watermark(task_conf)
+        params = None if watermark is None else {"watermark": watermark}
+
+        if task_conf.get("partition") is not None:
+            result = None
+            latest = self._partitioned_query(query, params, timeout_seconds, task_conf)
+        else:
+            result, latest = self._run_query(query, params, timeout_seconds, task_conf)
+
+        if watermark is not None:
+            # rows are sent before persisting, so a failed run is fetched again
+            if row_count(result):
+                NodeGraph.send_result(result, task_conf["outputs"], self.fused_ids)
+            if latest is not None:
+                StateStore.set(self.id(), f"{self.name}/{task_name}", to_json_safe(latest))
+            return None
+
+        return result
+
+    def _run_query(
+        self, query: "Query", params: dict | None, timeout_seconds: int, task_conf: dict
+    ) -> tuple["Data | None", typing.Any]:
+        """Runs the query on a pooled connection and returns its result unless it was
+        streamed, together with the latest watermark."""
+        with self._pooled_connection(timeout_seconds) as conn:
+            if task_conf.get("copy"):
+                return None, self._copy_query(conn, query, params, task_conf)
+            if task_conf["stream"]:
+                return None, self._stream_query(conn, query, params, task_conf)
+            return self._fetch_query(conn, query, params, task_conf)
+
+    @contextlib.contextmanager
+    def _pooled_connection(self, timeout_seconds: int) -> typing.Iterator[typing.Any]:
+        """Yields a connection of the pool with the statement timeout of the task. Waits for
+        a free connection, as the pool raises instead of blocking when it is exhausted."""
+        if not self._free_connections.acquire(timeout=Deadline.timeout(timeout_seconds)):
+            raise PoolError(f"No free connection of source `{self.name}` within the timeout.")
+
+        try:
+            conn = self._connection.getconn()
+        except BaseException:
+            self._free_connections.release()
+            raise
+
         try:
-            cursor = conn.cursor(cursor_factory=RealDictCursor)
+            # the server cancels the query on expiry, the pool rolls the connection back
+            with Deadline.on_expiry(conn.cancel):
+                timeout_ms = int(Deadline.timeout(timeout_seconds) * 1000)
+                with conn.cursor() as cursor:
+                    cursor.execute(f"SET statement_timeout = {max(1, timeout_ms)}")
+
+                yield conn
+
+        finally:
+            self._connection.putconn(conn)
+            self._free_connections.release()
+
+    def _partitioned_query(
+        self, query: str, params: dict | None, timeout_seconds: int, task_conf: dict
+    ) -> typing.Any:
+        """Splits the query into ranges of the partition column, which run concurrently on
+        the pool and send their rows into the graph as they arrive.
+        Returns the latest watermark once all partitions succeeded."""
+        partition_conf = task_conf["partition"]
+        column = sql.Identifier(partition_conf["column"])
+
+        lower, upper = partition_conf.get("lower"), partition_conf.get("upper")
+        if lower is None or upper is None:
+            bounds_query = sql.SQL(
+                "SELECT min({c}) AS lower, max({c}) AS upper FROM ({q}) AS riveer_bounds"
+            ).format(c=column, q=sql.SQL(query))
+
+            with self._pooled_connection(timeout_seconds) as conn, conn.cursor() as cursor:
+                cursor.execute(bounds_query, params)
+                min_value, max_value = cursor.fetchone()
+
+            lower = min_value if lower is None else lower
+            upper = max_value if upper is None else upper
+
+        # an empty result has no bounds to split
+        if lower is None or upper is None:
+            return self._send_partition(query, params, timeout_seconds, task_conf)
+
+        queries = [
+            sql.SQL("SELECT * FROM ({q}) AS riveer_partition WHERE {p}").format(
+                q=sql.SQL(query), p=predicate
+            )
+            for predicate in self._partition_predicates(
+                column, _split_range(lower, upper, partition_conf["count"])
+            )
+        ]
+
+        # one connection is left for other tasks of the source in the process
+        parallelism = partition_conf.get("parallelism", max(1, self._maxconn - 1))
+        workers = min(len(queries), parallelism)
+        with ThreadPoolExecutor(workers, thread_name_prefix=f"postgresql-{self.name}") as executor:
+            # each partition runs in a copy of the task's context, keeping its trace and deadline
+            futures = [
+                executor.submit(
+                    contextvars.copy_context().run,
+                    self._send_partition,
+                    *(partition_query, params, timeout_seconds, task_conf),
+                )
+                for partition_query in queries
+            ]
+
+            done, pending = wait(futures, return_when=FIRST_EXCEPTION)
+            for future in pending:
+                future.cancel()
+
+            latest = [future.result() for future in done]
 
-            cursor.execute(f"SET statement_timeout = {timeout_seconds * 1000}")
-            cursor.execute(query)
+        return max((value for value in latest if value is not None), default=None)
 
+    def _send_partition(
+        self, query: "Query", params: dict | None, timeout_seconds: int, task_conf: dict
+    ) -> typing.Any:
+        """Runs one partition and sends its rows, returning its latest watermark."""
+        result, latest = self._run_query(query, params, timeout_seconds, task_conf)
+
+        if row_count(result):
+            NodeGraph.send_result(result, task_conf["outputs"], self.fused_ids)
+
+        return latest
+
+    @staticmethod
+    def _partition_predicates(
+        column: sql.Identifier, boundaries: list[typing.Any]
+    ) -> list[sql.Composable]:
+        """Returns a predicate per range between the boundaries. The outer ranges are open,
+        so rows outside the bounds or without a value are still part of a partition."""
+        inner = boundaries[1:-1]
+        predicates = [sql.SQL("{c} < {v}").format(c=column, v=sql.Literal(inner[0]))]
+
+        for start, end in zip(inner, inner[1:]):
+            predicates.append(
+                sql.SQL("{c} >= {s} AND {c} < {e}").format(
+                    c=column, s=sql.Literal(start), e=sql.Literal(end)
+                )
+            )
+
+        predicates.append(
+            sql.SQL("{c} >= {v} OR {c} IS NULL").format(c=column, v=sql.Literal(inner[-1]))
+        )
+        return predicates
+
+    def _load_watermark(self, task_conf: dict) -> typing.Any:
+        """Returns the last seen watermark value of a task if it defines one."""
+        if (watermark_conf := task_conf.get("watermark")) is None:
+            return None
+
+        key = f"{self.name}/{task_conf['name']}"
+        return StateStore.get(self.id(), key, watermark_conf["initial"])
+
+    @staticmethod
+    def _latest_value(rows: list[tuple], index: int | None, latest: typing.Any) -> typing.Any:
+        """Returns the highest non-null value of the watermark column."""
+        if index is None:
+            return latest
+
+        values = [row[index] for row in rows if row[index] is not None]
+        if latest is not None:
+            values.append(latest)
+
+        return max(values, default=None)
+
+    @staticmethod
+    def _watermark_index(converter: RowConverter, task_conf: dict) -> int | None:
+        """Returns the position of the watermark column in the rows if any."""
+        if (watermark_conf := task_conf.get("watermark")) is None:
+            return None
+
+        return converter.column_index(watermark_conf["column"])
+
+    @staticmethod
+    def _convert(converter: RowConverter, rows: list[tuple], task_conf: dict) -> "Data":
+        """Returns the rows as documents or as a columnar batch in the task's format."""
+        if task_conf["format"] == "columnar":
+            return ColumnarBatch(converter.convert_columns(rows))
+
+        return converter.convert(rows)
+
+    def _fetch_query(self, conn, query: "Query", params: dict | None, task_conf: dict):
+        """Fetches the whole result at once and returns it with the latest watermark."""
+        with conn.cursor() as cursor:
+            cursor.execute(query, params)
             rows = cursor.fetchall()
-            json_results = json.loads(json.dumps(rows, default=str))
+            converter = RowConverter(cursor.description)
+
+        latest = self._latest_value(rows, self._watermark_index(converter, task_conf), None)
+
+        return self._convert(converter, rows, task_conf), latest
+
+    def _stream_query(self, conn, query: "Query", params: dict | None, task_conf: dict):
+        """Fetches the result through a server-side cursor and sends each chunk
+        into the graph as it arrives, so memory is bound by the chunk size."""
+        chunk_size = task_conf["chunk_size"]
+        converter, index, latest = None, None, None
+
+        cursor = conn.cursor(name=f"riveer_{uuid.uuid4().hex}")
+        try:
+            cursor.itersize = chunk_size
+            cursor.execute(query, params)
+
+            while rows := cursor.fetchmany(chunk_size):
+                # named cursors only know their description after the first fetch
+                if converter is None:
+                    converter = RowConverter(cursor.description)
+                    index = self._watermark_index(converter, task_conf)
 
-            return json_results
+                latest = self._latest_value(rows, index, latest)
+                results = self._convert(converter, rows, task_conf)
+                NodeGraph.send_result(results, task_conf["outputs"], self.fused_ids)
 
         finally:
-            self._connection.putconn(conn)
+            # a cancelled query aborts the transaction, which already dropped the cursor
+            if conn.info.transaction_status != TRANSACTION_STATUS_INERROR:
+                cursor.close()
+
+        return latest
+
+    def _copy_query(self, conn, query: "Query", params: dict | None, task_conf: dict):
+        """Exports the result with `COPY` and sends each decoded chunk into the graph
+        as it arrives. Returns the latest watermark."""
+        export = CopyExport(conn, query, params, task_conf["copy"])
+        column, key, latest = None, None, None
+
+        if (watermark_conf := task_conf.get("watermark")) is not None:
+            column = watermark_conf["column"]
+            if column not in export.columns:
+                raise ValueError(f"Column `{column}` is not part of the query result.")
+
+            # decoded numeric values are strings, which do not compare by value
+            numeric = export.type_codes[export.columns.index(column)] == NUMERIC
+            key = decimal.Decimal if numeric else None
+
+        for results in export.batches(task_conf["chunk_size"]):
+            if column is not None:
+                values = [row[column] for row in results if row[column] is not None]
+                latest = max(values + ([] if latest is None else [latest]), key=key, default=None)
+
+            if task_conf["format"] == "columnar":
+                results = ColumnarBatch.from_rows(results, export.columns)
+
+            NodeGraph.send_result(results, task_conf["outputs"], self.fused_ids)
+
+        return latest
 
     def shutdown(self) -> None:
         if self._connection is not None:
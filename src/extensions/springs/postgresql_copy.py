@@ -0,0 +1,422 @@
+import contextlib
+import datetime
+import decimal
+import io
+import json
+import os
+import re
+import struct
+import threading
+import typing
+import uuid
+import zoneinfo
+
+from psycopg2.extensions import encodings
+
+from extensions.springs import postgresql_types as pg
+
+type Decoder = typing.Callable[[typing.Any], typing.Any]
+
+BUFFER_SIZE = 1 << 20
+
+_BINARY_SIGNATURE = b"PGCOPY\n\xff\r\n\x00"
+_INT16 = struct.Struct(">h")
+_INT32 = struct.Struct(">i")
+_INT64 = struct.Struct(">q")
+_HEADER = struct.Struct(">ii")
+_NUMERIC_HEADER = struct.Struct(">hhHH")
+
+_EPOCH = datetime.datetime(2000, 1, 1)
+_EPOCH_DATE = datetime.date(2000, 1, 1)
+_NUMERIC_CONTEXT = decimal.Context(prec=1000)
+_NUMERIC_SPECIAL = {0xC000: "NaN", 0xD000: "Infinity", 0xF000: "-Infinity"}
+
+_CSV_FIELD = re.compile(r'"((?:[^"]|"")*)"|([^,]*)')
+_INTERVAL = re.compile(r"(-?\d+) (year|mon|day)s?|([-+]?)(\d+):(\d+):(\d+(?:\.\d+)?)")
+_INTERVAL_DAYS = {"year": 365, "mon": 30, "day": 1}
+
+
+class _Incomplete(Exception):
+    """Raised when a tuple of binary COPY continues in the next block of the stream."""
+
+
+def _split_csv(line: str) -> list[str | None]:
+    """Splits a CSV line of PostgreSQL into its values. Empty strings are always quoted,
+    so only empty unquoted values are NULL."""
+    if '"' not in line:
+        return [value or None for value in line.split(",")]
+
+    values, position = [], 0
+    while True:
+        match = _CSV_FIELD.match(line, position)
+        quoted, plain = match.groups()
+        values.append(plain or None if quoted is None else quoted.replace('""', '"'))
+
+        if (position := match.end()) >= len(line):
+            return values
+        position += 1
+
+
+def _parse_array(text: str, element: Decoder | None) -> list:
+    """Parses a PostgreSQL array literal like `{1,NULL,"a b"}`, including nested arrays."""
+    stack: list[list] = []
+    result: list = []
+    i, length = 0, len(text)
+
+    while i < length:
+        char = text[i]
+
+        if char == "{":
+            stack.append([])
+            i += 1
+        elif char == "}":
+            result = stack.pop()
+            if stack:
+                stack[-1].append(result)
+            i += 1
+        elif char == ",":
+            i += 1
+        elif char == '"':
+            value, i = [], i + 1
+            while text[i] != '"':
+                if text[i] == "\\":
+                    i += 1
+                value.append(text[i])
+                i += 1
+
+            value = "".join(value)
+            stack[-1].append(value if element is None else element(value))
+            i += 1
+        else:
+            end = i
+            while text[end] not in ",}":
+                end += 1
+
+            value = text[i:end]
+            if value == "NULL":
+                stack[-1].append(None)
+            else:
+                stack[-1].append(value if element is None else element(value))
+            i = end
+
+    return result
+
+
+def _array(element: Decoder | None) -> Decoder:
+    return lambda text: _parse_array(text, element)
+
+
+def _time(parse: Decoder, infinity: typing.Any) -> Decoder:
+    """Returns a decoder of time values into the string form of the cursor's value."""
+
+    def decode(text: str) -> str:
+        if text in ("infinity", "-infinity"):
+            return str(infinity.max if text == "infinity" else infinity.min)
+        return str(parse(text))
+
+    return decode
+
+
+def _decode_interval(text: str) -> str:
+    """Returns the string form of the interval as `timedelta`, which counts months as 30
+    and years as 365 days like the cursor."""
+    days, seconds = 0, 0.0
+    for number, unit, sign, hours, minutes, rest in _INTERVAL.findall(text):
+        if unit:
+            days += int(number) * _INTERVAL_DAYS[unit]
+        else:
+            seconds = int(hours) * 3600 + int(minutes) * 60 + float(rest)
+            seconds = -seconds if sign == "-" else seconds
+
+    return str(datetime.timedelta(days=days, seconds=seconds))
+
+
+def _decode_text_numeric(text: str) -> str:
+    return str(decimal.Decimal(text))
+
+
+_decode_text_date = _time(datetime.date.fromisoformat, datetime.date)
+_decode_text_timestamp = _time(datetime.datetime.fromisoformat, datetime.datetime)
+
+# Text decoders of the columns, returning the same values as the cursor and `RowConverter`.
+_TEXT_DECODERS: dict[int, Decoder] = {
+    pg.BOOL: lambda value: value == "t",
+    pg.INT2: int,
+    pg.INT4: int,
+    pg.INT8: int,
+    pg.OID: int,
+    pg.FLOAT4: float,
+    pg.FLOAT8: float,
+    pg.JSON: json.loads,
+    pg.JSONB: json.loads,
+    pg.BOOL_ARRAY: _array(lambda value: value == "t"),
+    pg.INT2_ARRAY: _array(int),
+    pg.INT4_ARRAY: _array(int),
+    pg.INT8_ARRAY: _array(int),
+    pg.FLOAT4_ARRAY: _array(float),
+    pg.FLOAT8_ARRAY: _array(float),
+    pg.TEXT_ARRAY: _array(None),
+    pg.VARCHAR_ARRAY: _array(None),
+    pg.NUMERIC: _decode_text_numeric,
+    pg.DATE: _decode_text_date,
+    pg.TIME: _time(datetime.time.fromisoformat, datetime.time),
+    pg.TIMETZ: _time(datetime.time.fromisoformat, datetime.time),
+    pg.TIMESTAMP: _decode_text_timestamp,
+    pg.TIMESTAMPTZ: _decode_text_timestamp,
+    pg.INTERVAL: _decode_interval,
+    pg.NUMERIC_ARRAY: _array(_decode_text_numeric),
+    pg.DATE_ARRAY: _array(_decode_text_date),
+    pg.TIMESTAMP_ARRAY: _array(_decode_text_timestamp),
+    pg.TIMESTAMPTZ_ARRAY: _array(_decode_text_timestamp),
+}
+
+
+def _decode_numeric(value: bytes) -> str:
+    ndigits, weight, sign, dscale = _NUMERIC_HEADER.unpack_from(value)
+    if sign in _NUMERIC_SPECIAL:
+        return _NUMERIC_SPECIAL[sign]
+
+    digits = struct.unpack_from(f">{ndigits}H", value, _NUMERIC_HEADER.size)
+    number = decimal.Decimal(
+        (
+            int(sign == 0x4000),
+            tuple(int(d) for group in digits for d in f"{group:04d}"),
+            (weight - ndigits + 1) * 4,
+        )
+    )
+    return str(number.quantize(decimal.Decimal(1).scaleb(-dscale), context=_NUMERIC_CONTEXT))
+
+
+def _decode_date(value: bytes) -> str:
+    days = _INT32.unpack(value)[0]
+    if days in (2**31 - 1, -(2**31)):
+        return str(datetime.date.max if days > 0 else datetime.date.min)
+    return (_EPOCH_DATE + datetime.timedelta(days=days)).isoformat()
+
+
+def _decode_timestamp(zone: datetime.tzinfo | None = None) -> Decoder:
+    """Returns a decoder of timestamps, which are rendered in the `zone` if they have one."""
+
+    def decode(value: bytes) -> str:
+        microseconds = _INT64.unpack(value)[0]
+        if microseconds in (2**63 - 1, -(2**63)):
+            return str(datetime.datetime.max if microseconds > 0 else datetime.datetime.min)
+
+        moment = _EPOCH + datetime.timedelta(microseconds=microseconds)
+        if zone is None:
+            return str(moment)
+        return str(moment.replace(tzinfo=datetime.timezone.utc).astimezone(zone))
+
+    return decode
+
+
+def _session_zone(conn) -> datetime.tzinfo:
+    """Returns the time zone of the session, in which the cursor returns `timestamptz` values.
+    Zones unknown to Python, like POSIX offsets, fall back to their current offset."""
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT current_setting('TimeZone'), EXTRACT(TIMEZONE FROM now())")
+        name, offset = cursor.fetchone()
+
+    try:
+        return zoneinfo.ZoneInfo(name)
+    except (zoneinfo.ZoneInfoNotFoundError, ValueError, OSError):
+        return datetime.timezone(datetime.timedelta(seconds=int(offset)))
+
+
+def _decode_text(value: bytes) -> str:
+    return value.decode("utf-8")
+
+
+# Binary decoders, returning the same values as the cursor and `RowConverter`.
+_BINARY_DECODERS: dict[int, Decoder] = {
+    pg.BOOL: lambda value: value != b"\x00",
+    pg.INT2: lambda value: _INT16.unpack(value)[0],
+    pg.INT4: lambda value: _INT32.unpack(value)[0],
+    pg.INT8: lambda value: _INT64.unpack(value)[0],
+    pg.OID: lambda value: struct.unpack(">I", value)[0],
+    pg.FLOAT4: lambda value: struct.unpack(">f", value)[0],
+    pg.FLOAT8: lambda value: struct.unpack(">d", value)[0],
+    pg.CHAR: _decode_text,
+    pg.NAME: _decode_text,
+    pg.TEXT: _decode_text,
+    pg.BPCHAR: _decode_text,
+    pg.VARCHAR: _decode_text,
+    pg.JSON: json.loads,
+    pg.JSONB: lambda value: json.loads(value[1:]),
+    pg.NUMERIC: _decode_numeric,
+    pg.DATE: _decode_date,
+    pg.TIMESTAMP: _decode_timestamp(),
+    # replaced by a decoder of the session's time zone
+    pg.TIMESTAMPTZ: _decode_timestamp(datetime.timezone.utc),
+    pg.UUID: lambda value: str(uuid.UUID(bytes=value)),
+    pg.BYTEA: lambda value: "\\x" + value.hex(),
+}
+
+
+class CopyExport:
+    """Streams the result of a query through `COPY ... TO STDOUT` and decodes it into
+    batches of JSON-safe rows as it arrives, so the result is never held in memory.
+    The copy runs in a thread writing into a pipe, which is parsed in the calling thread."""
+
+    def __init__(self, conn, query: typing.Any, params: dict | None, copy_format: str):
+        self._conn = conn
+        self._format = copy_format
+        self._error: BaseException | None = None
+
+        with conn.cursor() as cursor:
+            statement = cursor.mogrify(query, params).decode(encodings[conn.encoding])
+            cursor.execute(f"SELECT * FROM ({statement}) AS riveer_copy LIMIT 0")
+            description = cursor.description
+
+        self._statement = statement
+        self.columns = [column.name for column in description]
+        self.type_codes = [column.type_code for column in description]
+        self._binary_decoders = _BINARY_DECODERS
+
+        if copy_format == "binary":
+            unsupported = [
+                column.name
+                for column in description
+                if column.type_code not in _BINARY_DECODERS
+            ]
+            if unsupported:
+                raise ValueError(
+                    f"Columns `{', '.join(unsupported)}` cannot be decoded from binary COPY, "
+                    "use the csv format instead."
+                )
+
+            if pg.TIMESTAMPTZ in self.type_codes:
+                decoder = _decode_timestamp(_session_zone(conn))
+                self._binary_decoders = _BINARY_DECODERS | {pg.TIMESTAMPTZ: decoder}
+
+    def batches(self, size: int) -> typing.Iterator[list[dict]]:
+        """Yields the decoded rows in lists of up to `size` rows."""
+        read_fd, write_fd = os.pipe()
+        writer = threading.Thread(target=self._copy, args=(write_fd,), daemon=True)
+        writer.start()
+
+        try:
+            with open(read_fd, "rb", buffering=BUFFER_SIZE) as source:
+                reader = self._read_binary if self._format == "binary" else self._read_csv
+
+                batch = []
+                for row in reader(source):
+                    batch.append(row)
+                    if len(batch) >= size:
+                        yield batch
+                        batch = []
+
+                if batch:
+                    yield batch
+
+        except BaseException:
+            # the server is stopped when the consumer failed or stopped reading early
+            cancelled = writer.is_alive() and self._error is None
+            if cancelled:
+                self._conn.cancel()
+            writer.join()
+
+            # a failed copy truncates the output, so its error is the cause
+            if self._error is not None and not cancelled:
+                raise self._error from None
+            raise
+
+        writer.join()
+        if self._error is not None:
+            raise self._error
+
+    def _copy(self, write_fd: int) -> None:
+        options = "FORMAT binary" if self._format == "binary" else "FORMAT csv, ENCODING 'UTF8'"
+
+        sink = open(write_fd, "wb", buffering=BUFFER_SIZE)  # pylint: disable=consider-using-with
+        try:
+            with self._conn.cursor() as cursor:
+                cursor.copy_expert(
+                    f"COPY ({self._statement}) TO STDOUT WITH ({options})", sink, size=BUFFER_SIZE
+                )
+            sink.flush()
+
+        except BrokenPipeError:
+            pass
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            self._error = e
+
+        finally:
+            # the error is set before closing the pipe, so the reader sees it at its end
+            with contextlib.suppress(BrokenPipeError):
+                sink.close()
+
+    def _read_csv(self, source: typing.BinaryIO) -> typing.Iterator[dict]:
+        columns = self.columns
+        decoders = [
+            (i, decoder)
+            for i, type_code in enumerate(self.type_codes)
+            if (decoder := _TEXT_DECODERS.get(type_code)) is not None
+        ]
+
+        # quoted values may contain line breaks, which leave an odd number of quotes
+        lines = io.TextIOWrapper(source, encoding="utf-8", newline="\n")
+        for line in lines:
+            while line.count('"') % 2:
+                if not (rest := lines.readline()):
+                    raise ValueError("CSV COPY output ended within a quoted value.")
+                line += rest
+
+            # servers on Windows end rows with a carriage return as well
+            values = _split_csv(line.rstrip("\r\n"))
+            for i, decoder in decoders:
+                if values[i] is not None:
+                    values[i] = decoder(values[i])
+
+            yield dict(zip(columns, values))
+
+    def _read_binary(self, source: typing.BinaryIO) -> typing.Iterator[dict]:
+        columns = self.columns
+        decoders = [self._binary_decoders[type_code] for type_code in self.type_codes]
+        unpack_int16, unpack_int32 = _INT16.unpack_from, _INT32.unpack_from
+
+        buffer = source.read(BUFFER_SIZE)
+        if not buffer.startswith(_BINARY_SIGNATURE):
+            raise ValueError("Binary COPY output is missing its header.")
+
+        _, extension_length = _HEADER.unpack_from(buffer, len(_BINARY_SIGNATURE))
+        position = len(_BINARY_SIGNATURE) + _HEADER.size + extension_length
+
+        # tuples are parsed from blocks of the stream, a partial one is completed by the next
+        size = len(buffer)
+        while True:
+            start = position
+            try:
+                if position + 2 > size:
+                    raise _Incomplete
+                if unpack_int16(buffer, position)[0] == -1:
+                    return
+                position += 2
+
+                values = []
+                for decoder in decoders:
+                    if position + 4 > size:
+                        raise _Incomplete
+                    length = unpack_int32(buffer, position)[0]
+                    position += 4
+
+                    if length == -1:
+                        values.append(None)
+                        continue
+
+                    end = position + length
+                    if end > size:
+                        raise _Incomplete
+
+                    values.append(decoder(buffer[position:end]))
+                    position = end
+
+            except _Incomplete:
+                if not (block := source.read(BUFFER_SIZE)):
+                    raise ValueError("Binary COPY output ended before its trailer.") from None
+
+                buffer, position = buffer[start:] + block, 0
+                size = len(buffer)
+                continue
+
+            yield dict(zip(columns, values))
@@ -0,0 +1,106 @@
+import typing
+
+# Type OIDs as defined in the `pg_type` catalog of PostgreSQL.
+BOOL, BYTEA, CHAR, NAME, INT8, INT2, INT4, TEXT, OID = 16, 17, 18, 19, 20, 21, 23, 25, 26
+JSON, FLOAT4, FLOAT8, BPCHAR, VARCHAR, JSONB = 114, 700, 701, 1042, 1043, 3802
+DATE, TIME, TIMESTAMP, TIMESTAMPTZ, INTERVAL, TIMETZ = 1082, 1083, 1114, 1184, 1186, 1266
+NUMERIC, UUID = 1700, 2950
+
+BOOL_ARRAY, INT2_ARRAY, INT4_ARRAY, INT8_ARRAY = 1000, 1005, 1007, 1016
+TEXT_ARRAY, VARCHAR_ARRAY, FLOAT4_ARRAY, FLOAT8_ARRAY = 1009, 1015, 1021, 1022
+DATE_ARRAY, TIMESTAMP_ARRAY, TIMESTAMPTZ_ARRAY, NUMERIC_ARRAY = 1182, 1115, 1185, 1231
+
+type Converter = typing.Callable[[typing.Any], typing.Any]
+
+_JSON_NATIVE = (str, int, float, bool)
+
+
+def _to_str(value):
+    """Converts scalar values like `Decimal`, `datetime` or `UUID` into their string form."""
+    return None if value is None else str(value)
+
+
+def to_json_safe(value):
+    """Converts any value recursively into a JSON-safe object.
+    Unknown types are represented by their string form, like `json.dumps(default=str)`."""
+    if value is None or isinstance(value, _JSON_NATIVE):
+        return value
+    if isinstance(value, (list, tuple)):
+        return [to_json_safe(v) for v in value]
+    if isinstance(value, dict):
+        return {str(k): to_json_safe(v) for k, v in value.items()}
+
+    return str(value)
+
+
+# Columns of these types are already JSON-safe when returned by psycopg2.
+_IDENTITY_TYPES = {
+    *(BOOL, CHAR, NAME, INT8, INT2, INT4, TEXT, OID, JSON, FLOAT4, FLOAT8, BPCHAR, VARCHAR, JSONB),
+    *(BOOL_ARRAY, INT2_ARRAY, INT4_ARRAY, INT8_ARRAY),
+    *(TEXT_ARRAY, VARCHAR_ARRAY, FLOAT4_ARRAY, FLOAT8_ARRAY),
+}
+
+_CONVERTERS: dict[int, Converter] = {
+    NUMERIC: _to_str,
+    DATE: _to_str,
+    TIME: _to_str,
+    TIMESTAMP: _to_str,
+    TIMESTAMPTZ: _to_str,
+    INTERVAL: _to_str,
+    TIMETZ: _to_str,
+    UUID: _to_str,
+}
+
+
+def get_converter(type_code: int) -> Converter | None:
+    """Returns the converter for a column type or `None` if no conversion is required."""
+    if type_code in _IDENTITY_TYPES:
+        return None
+
+    return _CONVERTERS.get(type_code, to_json_safe)
+
+
+class RowConverter:
+    """Converts the rows of a cursor into JSON-safe dictionaries in one pass.
+    The converter of each column is resolved once from the cursor's description."""
+
+    def __init__(self, description: typing.Sequence):
+        self.columns = [column.name for column in description]
+        self._converters = [
+            (i, converter)
+            for i, column in enumerate(description)
+            if (converter := get_converter(column.type_code)) is not None
+        ]
+
+    def column_index(self, name: str) -> int:
+        """Returns the position of a column in the fetched rows."""
+        try:
+            return self.columns.index(name)
+        except ValueError as e:
+            raise ValueError(f"Column `{name}` is not part of the query result.") from e
+
+    def convert(self, rows: typing.Iterable[typing.Sequence]) -> list[dict]:
+        """Returns the provided tuple rows as JSON-safe dictionaries."""
+        columns = self.columns
+
+        if not self._converters:
+            return [dict(zip(columns, row)) for row in rows]
+
+        results = []
+        for row in rows:
+            values = list(row)
+            for i, converter in self._converters:
+                values[i] = converter(values[i])
+
+            results.append(dict(zip(columns, values)))
+
+        return results
+
+    def convert_columns(self, rows: typing.Sequence[typing.Sequence]) -> dict[str, list]:
+        """Returns the provided tuple rows as JSON-safe lists of values by column name."""
+        columns = [list(column) for column in zip(*rows)] if rows else [[] for _ in self.columns]
+
+        for i, converter in self._converters:
+            columns[i] = [converter(value) for value in columns[i]]
+
+        return dict(zip(self.columns, columns))
@@ -3,8 +3,20 @@ import os
 import sys
 
 from celery import Celery
+from celery.concurrency import get_implementation, prefork, solo
+from celery.signals import (
+    worker_init,
+    worker_process_init,
+    worker_process_shutdown,
+    worker_shutdown,
+)
+from celery.utils.log import current_process_index
 
 from core.app import AppController
+from core.compression import register_compressions
+from core.graph import NodeGraph
+from core.metrics import Metrics
+from core.payload import PayloadStore
 
 logging.basicConfig(
     level=logging.getLevelName(os.getenv("LOG_LEVEL", "INFO").upper()),
@@ -16,6 +28,23 @@ app = Celery(
     broker=os.getenv("RIVEER_BROKER", "amqp://guest@localhost:5672//"),
 )
 app.conf.broker_connection_retry_on_startup = True
+app.conf.task_serializer = os.getenv("RIVEER_SERIALIZER", "json")
+register_compressions()
+app.conf.task_compression = os.getenv("RIVEER_COMPRESSION")
+app.conf.accept_content = ["json", "msgpack"]
+app.conf.worker_prefetch_multiplier = int(os.getenv("RIVEER_PREFETCH_MULTIPLIER", "4"))
+
+if payload_folder := os.getenv("RIVEER_PAYLOAD_STORE"):
+    NodeGraph.set_payload_store(
+        PayloadStore(
+            payload_folder,
+            threshold=int(os.getenv("RIVEER_PAYLOAD_THRESHOLD", str(1024 * 1024))),
+            ttl=int(os.getenv("RIVEER_PAYLOAD_TTL", "3600")),
+        )
+    )
+
+if metrics_port := os.getenv("RIVEER_METRICS_PORT"):
+    Metrics.serve(int(metrics_port))
 
 
 @app.on_after_configure.connect
@@ -33,3 +62,39 @@ def load_application(**_kwargs):
 
     else:
         logging.info("Application loaded successfully. Starting Celery...")
+
+
+def connect_process():
+    try:
+        AppController.connect_process()
+
+    except Exception as e:
+        logging.critical("%s: Failed to connect nodes", e.__class__.__name__)
+        logging.critical("%s", str(e))
+        sys.exit(1)
+
+
+@worker_init.connect
+def connect_worker(sender, **_kwargs):
+    pool_cls = get_implementation(sender.pool_cls)
+
+    # process pools connect in each of their processes instead, after forking
+    if issubclass(pool_cls, prefork.TaskPool):
+        AppController.set_process_count(sender.concurrency)
+    elif not issubclass(pool_cls, solo.TaskPool):
+        connect_process()
+
+
+@worker_process_init.connect
+def connect_worker_process(**_kwargs):
+    # the server of the parent does not exist in forked processes
+    if metrics_port and (index := current_process_index()) is not None:
+        Metrics.serve(int(metrics_port) + index)
+
+    connect_process()
+
+
+@worker_process_shutdown.connect
+@worker_shutdown.connect
+def shutdown_worker(**_kwargs):
+    AppController.shutdown_process()